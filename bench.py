@@ -0,0 +1,140 @@
+"""
+Load benchmark for the server, running the planner event loop headless against simulated robots.
+
+Run with `python main.py bench --robots 200`. By default each robot is simply told to mine so that
+the benchmark doesn't depend on the external planner, pass --planner to replan with ENHSP instead.
+"""
+
+import argparse
+import asyncio
+import time
+
+import inference
+import logger
+import main
+import metrics
+import simulator
+import webserver
+import workers
+from miner import model, world
+
+# How often the event loop lag monitor wakes up
+lag_sample_interval = 0.1
+
+
+async def _monitor_event_loop_lag(exit_event: asyncio.Event):
+    """Record how late the event loop is to wake up a sleeping task"""
+    while not exit_event.is_set():
+        start_time = time.perf_counter()
+        await asyncio.sleep(lag_sample_interval)
+        metrics.record("event_loop_lag", time.perf_counter() - start_time - lag_sample_interval)
+
+
+def _sync_positions(agents: dict[int, main.Robot], simulated_robots: dict[int, simulator.SimulatedRobot]):
+    """The simulation knows exactly where each robot is, which a real deployment would track from spawn"""
+    for agent in agents.values():
+        agent.position = simulated_robots[agent.id].position
+        agent.direction = simulated_robots[agent.id].direction
+
+
+def _fixed_plan(simulated_robots: dict[int, simulator.SimulatedRobot]):
+    """Create a plan function that sends every robot mining, bypassing the planner"""
+    async def plan(agents: dict[int, main.Robot]) -> bool:
+        _sync_positions(agents, simulated_robots)
+        results = await asyncio.gather(*[agent.update_inventory() for agent in agents.values()])
+        for agent in agents.values():
+            agent.add_action("mine")
+        return all(results)
+
+    return plan
+
+
+def _planner_plan(simulated_robots: dict[int, simulator.SimulatedRobot]):
+    async def plan(agents: dict[int, main.Robot]) -> bool:
+        _sync_positions(agents, simulated_robots)
+        return await main.plan_actions(agents)
+
+    return plan
+
+
+def report(robot_count: int, duration: float):
+    """Print the measurements collected during the run"""
+    def milliseconds(name: str, percent: float) -> str:
+        return f"{metrics.percentile(name, percent) * 1000:.1f} ms"
+
+    print()
+    print(f"Benchmark results: {robot_count} robots over {duration:.1f}s")
+    print(f"  Commands/sec:              {metrics.count('commands') / duration:.1f}")
+    print(f"  send_command latency:      p50 {milliseconds('send_command', 50)}, p99 {milliseconds('send_command', 99)}")
+    print(f"  Planning wall time:        {len(metrics.samples('plan_actions'))} plans, "
+          f"mean {metrics.mean('plan_actions') * 1000:.1f} ms, p99 {milliseconds('plan_actions', 99)}")
+    print(f"  Planner (ENHSP) per replan: {len(metrics.samples('replan'))} replans, "
+          f"mean {metrics.mean('replan') * 1000:.1f} ms")
+    print(f"  Mining steps/sec:          {metrics.count('mining_steps') / duration:.1f}")
+    print(f"  Event loop lag:            p50 {milliseconds('event_loop_lag', 50)}, p99 {milliseconds('event_loop_lag', 99)}, "
+          f"max {max(metrics.samples('event_loop_lag'), default=0) * 1000:.1f} ms")
+
+
+async def _run(args):
+    try:
+        model.load_model()
+    except FileNotFoundError:
+        logger.error("miner/model.pt not found, mining with untrained weights", "Bench")
+        # Throughput doesn't depend on how well the robots mine
+        model.has_loaded_weights = True
+
+    # Blocks scanned in the simulated world shouldn't change the statistics saved for the real one
+    inference.ore_statistics_path = None
+    inference.depth_table_path = None
+    inference.prepare_depth_table()
+    await webserver.start_server(args.host, args.port)
+
+    environment = world.World(*args.size)
+    simulated_robots = simulator.spawn_robots(args.robots, environment, latency=args.latency, geolyzer_noise=args.noise)
+    robots_by_id = {robot.id: robot for robot in simulated_robots}
+    simulator_tasks = [asyncio.create_task(robot.run(args.host, args.port)) for robot in simulated_robots]
+
+    # Hold the planner until the whole fleet is connected, so each run starts from the same state
+    main.pause_event.set()
+    exit_event = asyncio.Event()
+    plan = _planner_plan(robots_by_id) if args.planner else _fixed_plan(robots_by_id)
+    loop_task = asyncio.create_task(main.event_loop(exit_event, plan=plan))
+
+    start_time = time.perf_counter()
+    while len(webserver.get_robots()) < args.robots:
+        if time.perf_counter() - start_time > args.connect_timeout:
+            logger.error(f"Only {len(webserver.get_robots())} of {args.robots} robots connected", "Bench")
+            break
+        await asyncio.sleep(0.1)
+
+    metrics.reset()
+    lag_task = asyncio.create_task(_monitor_event_loop_lag(exit_event))
+    main.pause_event.clear()
+
+    await asyncio.sleep(args.duration)
+    duration = metrics.elapsed()
+    exit_event.set()
+    await asyncio.gather(loop_task, lag_task)
+
+    for task in simulator_tasks:
+        task.cancel()
+    await asyncio.gather(*simulator_tasks, return_exceptions=True)
+
+    workers.shutdown()
+    report(len(robots_by_id), duration)
+
+
+def run_benchmark(argv: list[str]):
+    parser = argparse.ArgumentParser(prog="main.py bench", description="Benchmark the server against simulated robots")
+    parser.add_argument("--robots", type=int, default=50, help="Number of simulated robots to connect")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds to measure for once all robots are connected")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds of simulated network delay before each response")
+    parser.add_argument("--noise", type=float, default=2.0, help="Geolyzer noise, matching the geolyzerNoise config option")
+    parser.add_argument("--size", type=int, nargs=3, default=[64, 64, 64], metavar=("X", "Y", "Z"), help="World dimensions")
+    parser.add_argument("--planner", action="store_true", help="Plan with ENHSP instead of sending every robot mining")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=3000)
+    parser.add_argument("--connect-timeout", type=float, default=30.0, help="Seconds to wait for every robot to connect")
+    args = parser.parse_args(argv)
+
+    asyncio.run(_run(args))
@@ -1,7 +1,7 @@
 local os = require("os")
 local component = require("component")
 
-local clientVersion = "0.0.7"
+local clientVersion = "0.0.14"
 
 -- The client script is also copied into the computer that activates the assembler
 -- component.computer.isRobot() is mentioned in the docs, but doesn't appear to actually exist,
@@ -22,6 +22,7 @@ local sides = require("sides")
 local robot = require("robot")
 local shell = require("shell")
 local computer = require("computer")
+local event = require("event")
 
 if not component.isAvailable("internet") then
   print("Internet card not found.")
@@ -61,6 +62,9 @@ end
 -- Represent table as JSON string
 -- TODO: Add support for arrays
 local function toJson(table)
+  if next(table) == nil then
+    return "{};"
+  end
   local json = "{"
   for key, value in pairs(table) do
     json = json .. "\"" .. key .. "\": "
@@ -123,11 +127,62 @@ local function receive()
 end
 
 
+-- Mirror of which inventory slots have changed, so the server can request only the changes.
+-- Every inventory_changed signal bumps the generation, and each slot remembers the generation
+-- it last changed in. The session changes every time the client starts, which tells the server
+-- that generations it has seen before are meaningless and a full inventory scan is needed.
+math.randomseed(os.time())
+local inventorySession = string.format("%x%x", os.time(), math.random(0, 0x7FFFFFFF))
+local inventoryGeneration = 0
+local slotGenerations = {}
+
+event.listen("inventory_changed", function(_, slot)
+  inventoryGeneration = inventoryGeneration + 1
+  slotGenerations[slot] = inventoryGeneration
+end)
+
+-- Signals are only handled while the client is waiting, so process any queued by the last command
+local function processInventoryEvents()
+  while event.pull(0, "inventory_changed") do end
+end
+
+local function readSlot(slot)
+  local stack = inv_controller.getStackInInternalSlot(slot)
+  if stack then
+    -- Many modded items share an ID, and are distinguished by their data value
+    return {name = stack.name, count = stack.size, dataValue = stack.damage}
+  end
+  -- Empty slots are sent as false so that emptied slots appear in inventory deltas
+  return false
+end
+
+
+-- Responses are written through reply() rather than directly to the connection,
+-- so that a batch can collect the response of each command it runs
+local replyBuffer
+local exit = false
+local execute
+
+local function reply(data)
+  if replyBuffer then
+    table.insert(replyBuffer, data)
+  else
+    connection:write(data)
+  end
+end
+
+local function flush()
+  if not replyBuffer then
+    connection:flush()
+  end
+end
+
+
 local function acknowledge_or_error(success, error)
   if success then
-    connection:write("{\"success\": true};")
+    reply("{\"success\": true};")
   else
-    connection:write("{\"success\": false, \"error\": \"" .. error .. "\"};")
+    reply("{\"success\": false, \"error\": \"" .. error .. "\"};")
   end
 end
 
@@ -158,309 +213,425 @@ local function move(command)
 end
 
 
-local function loop()
-  local exit = false
-  while not exit do
-    local success, err = pcall(function()
-      local command = receive()
-      print("Received command: " .. command)
-      command = split(command)
+-- Commands that close the connection or don't reply with json can't be part of a batch
+local unbatchable = {batch = true, update = true, exit = true, reboot = true, scan_region = true}
 
-      if command[1] == "ping" then
-        connection:write("{\"success\": true};")
+-- Run a "|" separated list of commands and send all of their responses in one reply.
+-- Stops at the first command that fails, unless that command is prefixed with "?".
+local function batch(commands)
+  local results = {}
+  local success = true
+  for entry in commands:gmatch("([^|]+)") do
+    local optional = entry:sub(1, 1) == "?"
+    if optional then
+      entry = entry:sub(2)
+    end
+    local command = split(entry)
 
-      elseif command[1] == "version" then
-        connection:write("{\"success\": true, \"version\": \"" .. clientVersion .. "\"};")
+    replyBuffer = {}
+    if command[1] == nil or unbatchable[command[1]] then
+      reply(toJson({success = false, error = "Command can't be batched: " .. entry}))
+    else
+      local ok, err = pcall(execute, entry)
+      if not ok then
+        replyBuffer = {toJson({success = false, error = err})}
+      end
+    end
+    -- Strip the trailing semicolon so the responses can be joined into a json array
+    local result = table.concat(replyBuffer):sub(1, -2)
+    replyBuffer = nil
+
+    table.insert(results, result)
+    if not optional and result:find("\"success\": false", 1, true) then
+      success = false
+      break
+    end
+  end
 
-      elseif command[1] == "memory" then
-        connection:write(toJson({success = true, free = computer.freeMemory(), total = computer.totalMemory() }))
+  reply("{\"success\": " .. tostring(success) .. ", \"results\": [" .. table.concat(results, ", ") .. "]};")
+end
 
-      elseif command[1] == "move" then
-        move(command)
 
-      elseif command[1] == "turn" then
-        if command[2] == "left" then
-          robot.turnLeft()
-          connection:write("{\"success\": true};")
-        elseif command[2] == "right" then
-          robot.turnRight()
-          connection:write("{\"success\": true};")
-        else
-          connection:write("{\"success\": false, \"error\": \"Missing or unknown direction\"};")
-        end
+-- Run a single command, writing its response through reply()
+execute = function(message)
+  local command = split(message)
 
-      elseif command[1] == "detect" then
-        local passable, type = robot.detect()
-        local passableUp, typeUp = robot.detectUp()
-        local passableDown, typeDown = robot.detectDown()
-        connection:write(toJson({success = true, front = {passable = passable, type = type}, up = {passable = passableUp, type = typeUp}, down = {passable = passableDown, type = typeDown}}))
-
-      elseif command[1] == "use" then
-        local sneaky = command[2] == "true"
-        local success, action_type = robot.use(sides.front, sneaky)
-        if success then
-          connection:write("{\"success\": true, \"action\": \"" .. action_type .. "\"};")
-        else
-          connection:write("{\"success\": false, \"error\": \"No action taken\"};")
-        end
-        
-      elseif command[1] == "place" then
-        local side = command[2]
-
-        local success
-        local obstructed
-        local errorMessage = "Failed to place"
-        if robot.count() == 0 then
-          success = false
-          errorMessage = "Selected inventory slot is empty"
-        elseif side == "front" or side == nil then
-          success = robot.place()
-          obstructed = robot.detect()
-        elseif side == "up" then
-          success = robot.placeUp()
-          obstructed = robot.detectUp()
-        elseif side == "down" then
-          success = robot.placeDown()
-          obstructed = robot.detectDown()
-        else
-          success = false
-          errorMessage = "Invalid side"
-        end
+  if command[1] == "ping" then
+    reply("{\"success\": true};")
 
-        if obstructed and not success then
-          errorMessage = "Placement obstructed"
-        end
+  elseif command[1] == "version" then
+    reply("{\"success\": true, \"version\": \"" .. clientVersion .. "\"};")
 
-        acknowledge_or_error(success, errorMessage)
+  elseif command[1] == "memory" then
+    reply(toJson({success = true, free = computer.freeMemory(), total = computer.totalMemory() }))
 
-      elseif command[1] == "swing" then
-        local side = command[2]
+  elseif command[1] == "move" then
+    move(command)
 
-        local success
-        local errorMessage = "Failed to mine"
-        if side == "front" or side == nil then
-          success = robot.swing()
-        elseif side == "up" then
-          success = robot.swingUp()
-        elseif side == "down" then
-          success = robot.swingDown()
-        else
-          success = false
-          errorMessage = "Invalid side"
-        end
+  elseif command[1] == "turn" then
+    if command[2] == "left" then
+      robot.turnLeft()
+      reply("{\"success\": true};")
+    elseif command[2] == "right" then
+      robot.turnRight()
+      reply("{\"success\": true};")
+    else
+      reply("{\"success\": false, \"error\": \"Missing or unknown direction\"};")
+    end
 
-        acknowledge_or_error(success, errorMessage)
+  elseif command[1] == "detect" then
+    local passable, type = robot.detect()
+    local passableUp, typeUp = robot.detectUp()
+    local passableDown, typeDown = robot.detectDown()
+    reply(toJson({success = true, front = {passable = passable, type = type}, up = {passable = passableUp, type = typeUp}, down = {passable = passableDown, type = typeDown}}))
 
-      elseif command[1] == "insert" then
-        local side = command[2]
-        local dest_slot = tonumber(command[3])
-        local count = tonumber(command[4] or 1)
+  elseif command[1] == "use" then
+    local sneaky = command[2] == "true"
+    local success, action_type = robot.use(sides.front, sneaky)
+    if success then
+      reply("{\"success\": true, \"action\": \"" .. action_type .. "\"};")
+    else
+      reply("{\"success\": false, \"error\": \"No action taken\"};")
+    end
+    
+  elseif command[1] == "place" then
+    local side = command[2]
+
+    local success
+    local obstructed
+    local errorMessage = "Failed to place"
+    if robot.count() == 0 then
+      success = false
+      errorMessage = "Selected inventory slot is empty"
+    elseif side == "front" or side == nil then
+      success = robot.place()
+      obstructed = robot.detect()
+    elseif side == "up" then
+      success = robot.placeUp()
+      obstructed = robot.detectUp()
+    elseif side == "down" then
+      success = robot.placeDown()
+      obstructed = robot.detectDown()
+    else
+      success = false
+      errorMessage = "Invalid side"
+    end
 
-        if side ~= "front" and side ~= "up" and side ~= "down" then
-          connection:write("{\"success\": false, \"error\": \"Invalid side\"};")
-        elseif not dest_slot then
-          connection:write("{\"success\": false, \"error\": \"Missing or invalid destination slot\"};")
-        else
-          local success, reason = inv_controller.dropIntoSlot(sides[side], dest_slot, count)
-          acknowledge_or_error(success, reason or "Inventory not found or failed to transfer item(s)")
-        end
+    if obstructed and not success then
+      errorMessage = "Placement obstructed"
+    end
 
-      elseif command[1] == "select" then
-        local slot = tonumber(command[2])
-        if not slot then
-          connection:write("{\"success\": false, \"error\": \"Missing slot argument\"};")
-        elseif slot > robot.inventorySize() then
-          connection:write("{\"success\": false, \"error\": \"Slot out of bounds\"};")
-        end
-        robot.select(slot)
-        connection:write("{\"success\": true};")
+    acknowledge_or_error(success, errorMessage)
 
-      elseif command[1] == "transfer" then
-        local source_slot = tonumber(command[2])
-        local dest_slot = tonumber(command[3])
-        local count = tonumber(command[4])
+  elseif command[1] == "swing" then
+    local side = command[2]
 
-        if not source_slot or not dest_slot then
-          connection:write("{\"success\": false, \"error\": \"Invalid or missing slot argument\"};")
-        elseif source_slot > robot.inventorySize() or dest_slot > robot.inventorySize() then
-          connection:write("{\"success\": false, \"error\": \"Source or destination out of bounds\"};")
-        else
-          robot.select(source_slot)
-          robot.transferTo(dest_slot, count)
-          connection:write("{\"success\": true};")
-        end
+    local success
+    local errorMessage = "Failed to mine"
+    if side == "front" or side == nil then
+      success = robot.swing()
+    elseif side == "up" then
+      success = robot.swingUp()
+    elseif side == "down" then
+      success = robot.swingDown()
+    else
+      success = false
+      errorMessage = "Invalid side"
+    end
 
-      elseif command[1] == "take" then
-        local side = command[2]
-        local slot = tonumber(command[3])
-        if side == "front" or side == "down" or side == "up" then
-          if slot ~= nil then
-            local success = inv_controller.suckFromSlot(sides[side], slot)
-            acknowledge_or_error(success, "Failed to transfer item(s)")
-          else
-            connection:write("{\"success\": false, \"error\": \"Invalid or missing slot number argument\"};")
-          end
-        else
-          connection:write("{\"success\": false, \"error\": \"Invalid side\"};")
-        end
+    acknowledge_or_error(success, errorMessage)
 
-      elseif command[1] == "read" then
-        -- Read the contents of a slot from an adjacent inventory
-        local side = command[2]
-        local slot = tonumber(command[3])
-        if side == "front" or side == "down" or side == "up" then
-          if slot ~= nil then
-            local stack = inv_controller.getStackInSlot(sides[side], slot)
-            if stack then
-              -- Many modded items share an ID, and are distinguished by their data value
-              connection:write(toJson({success = true, stack = {name = stack.name, count = stack.size, dataValue = stack.damage}}))
-            else
-              connection:write("{\"success\": true, \"stack\": null};")
-            end
-          else
-            connection:write("{\"success\": false, \"error\": \"Invalid or missing slot number argument\"};")
-          end
-        else
-          connection:write("{\"success\": false, \"error\": \"Invalid side\"};")
-        end
+  elseif command[1] == "insert" then
+    local side = command[2]
+    local dest_slot = tonumber(command[3])
+    local count = tonumber(command[4] or 1)
 
-      elseif command[1] == "equip" then
-        local slot = command[2]
-        local error = false
-
-        -- Use either the currently selected slot or the one specified in the argument
-        if slot then
-          slot = tonumber(slot)
-          if (not slot) or slot > robot.inventorySize() then
-            connection:write("{\"success\": false, \"error\": \"Invalid slot argument\"};")
-            error = true
-          else 
-            robot.select(slot)
-          end
-        end
-        
-        if not error then
-          local success = inv_controller.equip()
-          acknowledge_or_error(success, "Unable to equip item")
-        end
+    if side ~= "front" and side ~= "up" and side ~= "down" then
+      reply("{\"success\": false, \"error\": \"Invalid side\"};")
+    elseif not dest_slot then
+      reply("{\"success\": false, \"error\": \"Missing or invalid destination slot\"};")
+    else
+      local success, reason = inv_controller.dropIntoSlot(sides[side], dest_slot, count)
+      acknowledge_or_error(success, reason or "Inventory not found or failed to transfer item(s)")
+    end
 
-      elseif command[1] == "drop" then
-        local quantity = tonumber(command[2])
-        local success = robot.dropUp(quantity)
-        acknowledge_or_error(success, "Items not removed from inventory")
-
-      elseif command[1] == "inventory" then
-        local inventory = {}
-        for i = 1, robot.inventorySize() do
-          local stack = inv_controller.getStackInInternalSlot(i)
-          if stack then
-            -- Many modded items share an ID, and are distinguished by their data value
-            inventory[i] = {name = stack.name, count = stack.size, dataValue = stack.damage}
-          end
-        end
-        connection:write(toJson({success = true, inventory = inventory, size = robot.inventorySize()}))
-
-      elseif command[1] == "durability" then
-        -- Get the durability of the currently equipped item as a value from 0 - 1, where 1 is full durability.
-        local durability, reason = robot.durability()
-        
-        if durability == nil then
-          connection:write(toJson({success = false, error = reason}))
+  elseif command[1] == "select" then
+    local slot = tonumber(command[2])
+    if not slot then
+      reply("{\"success\": false, \"error\": \"Missing slot argument\"};")
+    elseif slot > robot.inventorySize() then
+      reply("{\"success\": false, \"error\": \"Slot out of bounds\"};")
+    else
+      robot.select(slot)
+      reply("{\"success\": true};")
+    end
+
+  elseif command[1] == "transfer" then
+    local source_slot = tonumber(command[2])
+    local dest_slot = tonumber(command[3])
+    local count = tonumber(command[4])
+
+    if not source_slot or not dest_slot then
+      reply("{\"success\": false, \"error\": \"Invalid or missing slot argument\"};")
+    elseif source_slot > robot.inventorySize() or dest_slot > robot.inventorySize() then
+      reply("{\"success\": false, \"error\": \"Source or destination out of bounds\"};")
+    else
+      robot.select(source_slot)
+      robot.transferTo(dest_slot, count)
+      reply("{\"success\": true};")
+    end
+
+  elseif command[1] == "take" then
+    local side = command[2]
+    local slot = tonumber(command[3])
+    if side == "front" or side == "down" or side == "up" then
+      if slot ~= nil then
+        local success = inv_controller.suckFromSlot(sides[side], slot)
+        acknowledge_or_error(success, "Failed to transfer item(s)")
+      else
+        reply("{\"success\": false, \"error\": \"Invalid or missing slot number argument\"};")
+      end
+    else
+      reply("{\"success\": false, \"error\": \"Invalid side\"};")
+    end
+
+  elseif command[1] == "read" then
+    -- Read the contents of a slot from an adjacent inventory
+    local side = command[2]
+    local slot = tonumber(command[3])
+    if side == "front" or side == "down" or side == "up" then
+      if slot ~= nil then
+        local stack = inv_controller.getStackInSlot(sides[side], slot)
+        if stack then
+          -- Many modded items share an ID, and are distinguished by their data value
+          reply(toJson({success = true, stack = {name = stack.name, count = stack.size, dataValue = stack.damage}}))
         else
-          connection:write(toJson({success = true, durability = durability}))
+          reply("{\"success\": true, \"stack\": null};")
         end
+      else
+        reply("{\"success\": false, \"error\": \"Invalid or missing slot number argument\"};")
+      end
+    else
+      reply("{\"success\": false, \"error\": \"Invalid side\"};")
+    end
+
+  elseif command[1] == "equip" then
+    local slot = command[2]
+    local error = false
+
+    -- Use either the currently selected slot or the one specified in the argument
+    if slot then
+      slot = tonumber(slot)
+      if (not slot) or slot > robot.inventorySize() then
+        reply("{\"success\": false, \"error\": \"Invalid slot argument\"};")
+        error = true
+      else 
+        robot.select(slot)
+      end
+    end
+    
+    if not error then
+      local success = inv_controller.equip()
+      acknowledge_or_error(success, "Unable to equip item")
+    end
+
+  elseif command[1] == "drop" then
+    local quantity = tonumber(command[2])
+    local success = robot.dropUp(quantity)
+    acknowledge_or_error(success, "Items not removed from inventory")
 
-      elseif command[1] == "craft" then
-        -- Crafting recipe must be placed in a 3x3 area 
-        -- in the top-left of the robot's inventory
-        if not crafting then
-          connection:write("{\"success\": false, \"error\": \"Crafting module not installed\"};")
-          return
+  elseif command[1] == "inventory" then
+    processInventoryEvents()
+    local inventory = {}
+    for i = 1, robot.inventorySize() do
+      inventory[i] = readSlot(i) or nil
+    end
+    reply(toJson({success = true, inventory = inventory, size = robot.inventorySize(), session = inventorySession, generation = inventoryGeneration}))
+
+  elseif command[1] == "inventory_delta" then
+    -- Contents of every slot that changed after the given generation
+    local since = tonumber(command[2])
+    if not since then
+      reply("{\"success\": false, \"error\": \"Missing generation\"};")
+    else
+      processInventoryEvents()
+      local changes = {}
+      for slot, generation in pairs(slotGenerations) do
+        if generation > since then
+          changes[slot] = readSlot(slot)
         end
+      end
+      reply(toJson({success = true, changes = changes, size = robot.inventorySize(), session = inventorySession, generation = inventoryGeneration}))
+    end
+
+  elseif command[1] == "inventory_checksum" then
+    -- Sum of slot number times item count, lets the server check its predicted inventory
+    -- without the cost of reading every stack's details
+    local checksum = 0
+    for i = 1, robot.inventorySize() do
+      checksum = checksum + i * robot.count(i)
+    end
+    reply(toJson({success = true, checksum = checksum}))
 
-        local count = tonumber(command[2])
-        local success = crafting.craft(count);
-        acknowledge_or_error(success, "Recipe invalid")
+  elseif command[1] == "durability" then
+    -- Get the durability of the currently equipped item as a value from 0 - 1, where 1 is full durability.
+    local durability, reason = robot.durability()
+    
+    if durability == nil then
+      reply(toJson({success = false, error = reason}))
+    else
+      reply(toJson({success = true, durability = durability}))
+    end
 
-      elseif command[1] == "scan" then
-        local radius = tonumber(command[2]) or 12
+  elseif command[1] == "craft" then
+    -- Crafting recipe must be placed in a 3x3 area 
+    -- in the top-left of the robot's inventory
+    if not crafting then
+      reply("{\"success\": false, \"error\": \"Crafting module not installed\"};")
+      return
+    end
 
-        if radius > 15 then
-          connection:write("{\"success\": false, \"error\": \"radius too large (max 15)\"};")
-        elseif radius < 1 then
-          connection:write("{\"success\": false, \"error\": \"radius invalid\"};")
-        else
+    local count = tonumber(command[2])
+    local success = crafting.craft(count);
+    acknowledge_or_error(success, "Recipe invalid")
+
+  elseif command[1] == "scan_region" then
+    -- Scan a box at an offset from the robot, as tiles of up to 64 blocks (the most one geolyzer.scan
+    -- call returns). Arguments are the offset, size and tile size, each in x, y, z order.
+    -- Replies with a binary frame of each tile's values in turn, as returned by the geolyzer.
+    -- The server chooses the tile size and reassembles the tiles into a dense grid.
+    local args = {}
+    for i = 1, 9 do
+      args[i] = tonumber(command[i + 1])
+    end
+    local offsetX, offsetY, offsetZ, width, height, depth, tileWidth, tileHeight, tileDepth = table.unpack(args, 1, 9)
 
-          connection:write("{\"success\": true, \"data\": {")
-
-          local width = radius*2 + 1
-          for x = 0, width-1 do
-            local y_section = {}
-            for y = 0, width-1 do
-              -- Arguments in x, z, y order
-              -- Call returns a 64 element array, we need elements 1:width
-              local z_section = geolyzer.scan(x - radius, -radius, y - radius, 1, width, 1)
-              local z_data = {}
-              for z = 1, width do
-                z_data[z-1] = z_section[z]
-              end
-              y_section[y] = z_data
-            end
-            if x > 0 then connection:write(", ") end
-            connection:write("\"" .. tostring(x) .. "\": " .. toJson(y_section):sub(1, -2))
-            connection:flush()
+    if not (offsetX and offsetY and offsetZ and width and height and depth and tileWidth and tileHeight and tileDepth) then
+      reply("{\"success\": false, \"error\": \"Missing region or tile size\"};")
+    elseif math.min(width, height, depth, tileWidth, tileHeight, tileDepth) < 1 or tileWidth * tileHeight * tileDepth > 64 then
+      reply("{\"success\": false, \"error\": \"Invalid region or tile size\"};")
+    else
+      reply("#" .. tostring(width * height * depth * 4) .. ":")
+      for x = 0, width-1, tileWidth do
+        local layer = {}
+        for y = 0, height-1, tileHeight do
+          for z = 0, depth-1, tileDepth do
+            local w, h, d = math.min(tileWidth, width - x), math.min(tileHeight, height - y), math.min(tileDepth, depth - z)
+            -- Arguments in x, z, y order
+            local values = geolyzer.scan(offsetX + x, offsetZ + z, offsetY + y, w, d, h)
+            layer[#layer+1] = string.pack("<" .. string.rep("f", w*h*d), table.unpack(values, 1, w*h*d))
           end
-          connection:write("}};")
         end
+        reply(table.concat(layer))
+        flush()
+      end
+    end
 
-      elseif command[1] == "reboot" then
-        computer.shutdown(true)
+  elseif command[1] == "scan" then
+    local radius = tonumber(command[2]) or 12
 
-      elseif command[1] == "update" then
-        -- Download new copy of client.lua
-        -- Allows updating existing robots during development
-        local ok, err = shell.execute("wget -f http://localhost:8080/client client.lua")
-        if not ok then
-          connection:write("{\"success\": false, \"error\": \"" .. err or "nil" .. "\"};")
-        else
-          connection:write("{\"success\": true};")
-          connection:flush()
-          connection:close()
-          
-          local ok, err = shell.execute("client.lua")
-          if not ok then
-            print("Error restarting client: " .. err)
+    if radius > 15 then
+      reply("{\"success\": false, \"error\": \"radius too large (max 15)\"};")
+    elseif radius < 1 then
+      reply("{\"success\": false, \"error\": \"radius invalid\"};")
+    else
+
+      reply("{\"success\": true, \"data\": {")
+
+      local width = radius*2 + 1
+      for x = 0, width-1 do
+        local y_section = {}
+        for y = 0, width-1 do
+          -- Arguments in x, z, y order
+          -- Call returns a 64 element array, we need elements 1:width
+          local z_section = geolyzer.scan(x - radius, -radius, y - radius, 1, width, 1)
+          local z_data = {}
+          for z = 1, width do
+            z_data[z-1] = z_section[z]
           end
-          exit = true
+          y_section[y] = z_data
         end
+        if x > 0 then reply(", ") end
+        reply("\"" .. tostring(x) .. "\": " .. toJson(y_section):sub(1, -2))
+        flush()
+      end
+      reply("}};")
+    end
 
-      elseif command[1] == "exit" then
-        connection:write("{\"success\": true};")
-        connection:flush()
-        connection:close()
-        exit = true
+  elseif command[1] == "batch" then
+    batch(message:sub(#"batch " + 1))
 
-      elseif command[1] == "install" then
-        local newId = command[2] or "0"
+  elseif command[1] == "reboot" then
+    computer.shutdown(true)
 
-        -- On a system with 2 floppy disk drives, copy openos and the client onto the other drive
-        -- TODO: Error checking
-        shell.execute("install")
+  elseif command[1] == "update" then
+    -- Download new copy of client.lua
+    -- Allows updating existing robots during development
+    local ok, err = shell.execute("wget -f http://localhost:8080/client client.lua")
+    if not ok then
+      reply("{\"success\": false, \"error\": \"" .. err or "nil" .. "\"};")
+    else
+      reply("{\"success\": true};")
+      flush()
+      connection:close()
+      
+      local ok, err = shell.execute("client.lua")
+      if not ok then
+        print("Error restarting client: " .. err)
+      end
+      exit = true
+    end
 
-        shell.execute("cp /home/client.lua /mnt/home/client.lua")
-        shell.execute('echo "enabled = {"client"}" > /mnt/etc/rc.cfg')
-        shell.execute('echo "function start()\n    dofile("/home/client.lua")\nend" > /mnt/etc/rc.d/client.lua')
-        shell.execute('echo "return ' .. newId .. '" > /mnt/etc/rc.d/client.lua')
-        connection:write("{\"success\": true};")
+  elseif command[1] == "exit" then
+    reply("{\"success\": true};")
+    flush()
+    connection:close()
+    exit = true
 
-      else
-        connection:write(toJson({success = false, error = " Unknown command: " .. command[1] }))
+  elseif command[1] == "install" then
+    local newId = command[2] or "0"
+
+    -- On a system with 2 floppy disk drives, copy openos and the client onto the other drive
+    -- TODO: Error checking
+    shell.execute("install")
+
+    shell.execute("cp /home/client.lua /mnt/home/client.lua")
+    shell.execute('echo "enabled = {"client"}" > /mnt/etc/rc.cfg')
+    shell.execute('echo "function start()\n    dofile("/home/client.lua")\nend" > /mnt/etc/rc.d/client.lua')
+    shell.execute('echo "return ' .. newId .. '" > /mnt/etc/rc.d/client.lua')
+    reply("{\"success\": true};")
+
+  else
+    reply(toJson({success = false, error = " Unknown command: " .. command[1] }))
+  end
+end
+
+
+local function loop()
+  while not exit do
+    local requestId
+    local success, err = pcall(function()
+      local message = receive()
+      print("Received command: " .. message)
+
+      -- Commands arrive as "<request id> <command>", and every
+      -- response starts with the id of the request it answers
+      local command
+      requestId, command = message:match("^(%d+) (.*)$")
+      if not requestId then
+        requestId, command = "0", message
       end
-      connection:flush()
+      connection:write(requestId .. " ")
+
+      execute(command)
+      flush()
     end)
 
     if not success then
       print("Error: " .. err)
+      if not requestId then
+        connection:write("0 ")
+      end
       connection:write(toJson({success = false, error = err}))
       connection:flush()
     end
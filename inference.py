@@ -1,19 +1,102 @@
+import functools
+import json
 from math import log10
+import os
+import time
+import numpy as np
 from pgmpy.models import DiscreteBayesianNetwork
 from pgmpy.factors.discrete.CPD import TabularCPD
 from itertools import product
 from pgmpy.inference import VariableElimination
+import world_map
 
 # All of the y coordinates taken into account by the bayes net.
 # No point in accounting for below y=4, since bedrock gets in the way
 y_levels = [f"{i}" for i in range(4, 51)]
 
+# Ores a robot can be sent to look for, in the order determine_optimal_depth takes them
+ore_types = ["coal", "iron", "gold", "redstone", "diamond"]
+
+# Precomputed results for every combination of needed ores, saved between runs (or not saved if None)
+depth_table_path = "depth_table.json"
+# Increment when the bayes net or its distribution data changes, so saved tables are rebuilt
+depth_table_version = 2
+# Minimum seconds between rebuilding the depth table as robots scan more of the world
+depth_table_rebuild_interval = 1.0
+
+# Y level robots climb back up to after mining
+surface_level = 64
+# Mining steps in each trip underground, about as many blocks as an iron pickaxe can mine
+mining_session_steps = 250
+
+# Block counts from robots' scans, saved between runs (or not saved if None)
+ore_statistics_path = "ore_statistics.json"
+# Number of blocks at each y level the profiled distributions count as, when combined with scanned blocks
+prior_strength = 20000
+# Geolyzer noise grows with distance, and with the default geolyzerNoise of 2 it stays under
+# hardness_tolerance out to this many blocks, so closer readings can't be mistaken for another block
+max_sample_distance = 12
+ore_hardness = 3.0
+stone_hardness = 1.5
+# Readings within this of a block's hardness are counted as that block
+hardness_tolerance = 0.75
+
+# Ore combination (a bool for each of ore_types) to (best y level, probability of a useful block at each of y_levels)
+_depth_table: dict[tuple[bool, ...], tuple[int, list[float]]] | None = None
+# ore_estimator.version and time.monotonic() when the depth table was last built
+_depth_table_estimator_version = None
+_depth_table_build_time = 0.0
+
+
+# Distribution data obtained by scanning a 190x190 chunk area of the world 
+# (2.36 billion blocks!) using Just Enough Resources' /jer_profile command
+
+# Data covers y [4, 50]
+stone_distribution = [0.6077037, 0.7576785, 0.75672805, 0.75576496, 0.7545372, 0.75285023, 0.75158334, 0.75071996, 0.749829, 0.7495794, 0.7512247, 0.7533533, 0.7529744, 0.7523656, 0.7512067, 0.75028884, 0.7503957, 0.750659, 0.7504439, 0.7498299, 0.7492808, 0.74931055, 0.7497154, 0.74971235, 0.7490319, 0.7431343, 0.7295102, 0.70669425, 0.6987211, 0.68921417, 0.6791663, 0.66926473, 0.6586811, 0.64749664, 0.63739234, 0.62882334, 0.62529266, 0.6226649, 0.6197728, 0.6151598, 0.6078381, 0.59609854, 0.58099514, 0.56244713, 0.5008914, 0.50078267, 0.5002934]
+coal_distribution = [0.010294597, 0.012933377, 0.01276096, 0.012797417, 0.012949327, 0.013002495, 0.012830838, 0.012874349, 0.012944336, 0.012968425, 0.013009114, 0.01282194, 0.01279872, 0.012808268, 0.012635525, 0.012638563, 0.01265918, 0.0124768885, 0.012380534, 0.012479275, 0.012664388, 0.0126976995, 0.012662326, 0.012603516, 0.01258724, 0.012515951, 0.0124018015, 0.0119019095, 0.011763454, 0.011582465, 0.01137793, 0.011219727, 0.011121419, 0.010969726, 0.010809896, 0.010479167, 0.010457139, 0.010566515, 0.010409071, 0.010378798, 0.010336697, 0.01009809, 0.009709202, 0.009449652, 0.008504123, 0.008467882, 0.008406467]
+iron_distribution = [0.0065503474, 0.008143663, 0.008125434, 0.008115235, 0.008093099, 0.008087131, 0.007998806, 0.008023546, 0.008024957, 0.007940972, 0.007948459, 0.008082357, 0.008070638, 0.007932942, 0.008031901, 0.0079934895, 0.008037435, 0.007999023, 0.007858398, 0.00790408, 0.007975261, 0.007938802, 0.007894531, 0.007944444, 0.007936306, 0.007823025, 0.00767079, 0.007390625, 0.0073261717, 0.007191623, 0.007183702, 0.0070706382, 0.0069932723, 0.0068565537, 0.006869683, 0.0066986764, 0.006562283, 0.0064863283, 0.0065120445, 0.0063182507, 0.006342882, 0.0061929254, 0.006088108, 0.0058511286, 0.005171007, 0.0051611327, 0.005294922]
+gold_distribution = [0.0013436415, 0.0016307508, 0.0016289062, 0.0016026476, 0.001571072, 0.0015585937, 0.001584961, 0.0016157769, 0.0016050347, 0.0015330946, 0.0016294487, 0.0016286892, 0.001571506, 0.0015211588, 0.001538303, 0.0015467665, 0.001585395, 0.0016103516, 0.0015882162, 0.0015813803, 0.0015775824, 0.0015491536, 0.0015571831, 0.0015669488, 0.0015240886, 0.0014356554, 0.0008158637, 0.00022612847, 8.9735244e-05, 7.671441e-05, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
+diamond_distribution = [0.0009611545, 0.0012084418, 0.0011835938, 0.0011832683, 0.0011921658, 0.0011842448, 0.0012052951, 0.0012259114, 0.0011788195, 0.0010817057, 0.00059082033, 9.7873264e-05, 0.0]
+redstone_distribution = [0.0076826173, 0.009551215, 0.009431641, 0.009467773, 0.009530599, 0.009521375, 0.009644315, 0.009630642, 0.009543511, 0.0087910155, 0.004772461, 0.0007238498, 0.0]
+lapis_distribution = [0.00029144966, 0.00044574653, 0.0005157335, 0.00054144964, 0.0006308594, 0.00069173175, 0.0007355686, 0.0008128255, 0.00086317275, 0.0009120009, 0.0009561632, 0.00088986545, 0.00080707466, 0.00075531687, 0.00071614585, 0.00065570744, 0.00059461803, 0.0005249566, 0.00046961807, 0.0004097222, 0.0003343099, 0.0002873264, 0.00022265625, 0.00014811198, 8.344184e-05, 3.4613717e-05, 4.4487847e-06, 0.0]
+# Ores weren't found above the end of some of the lists
+for distribution in [coal_distribution, iron_distribution, gold_distribution, diamond_distribution, redstone_distribution, lapis_distribution]:
+    if len(distribution) < len(y_levels):
+        distribution += [0] * (len(y_levels) - len(distribution))
+
+ore_distributions = {"coal": coal_distribution, "iron": iron_distribution, "gold": gold_distribution,
+                     "redstone": redstone_distribution, "diamond": diamond_distribution}
+
 
 def _normalize_weights(array: list) -> list:
     total = sum(array)
     return [item / total for item in array]
 
 
+# Probability of the robot being at each y level while targeting another, indexed [target_y][robot_y].
+# The same values as the robot_y CPD in the bayes net.
+deviation_matrix = np.array([_normalize_weights([2**(-1 * abs(y - other_y) / 4) for other_y in range(4, 51)]) for y in range(4, 51)])
+
+# Every combination of needed ores (a bool for each of ore_types), in the order the depth table is built
+ore_combinations = list(product([True, False], repeat=len(ore_types)))
+
+
+def compute_probability_curves(stone: np.ndarray, ores: dict[str, np.ndarray], lapis: np.ndarray) -> np.ndarray:
+    """
+    Evaluate the bayes net built by _build_ore_probability_table in closed form, for every ore combination at once.
+    Each distribution has a probability for each of y_levels.
+    Returns the probability of a mined block being useful indexed [combination][target_y], in the order of ore_combinations.
+    """
+    needs = np.array(ore_combinations)[:, :, np.newaxis]
+    ore_probabilities = np.array([ores[ore] for ore in ore_types])[np.newaxis]
+    # Ores are independent given the y level, and each one must be present only if it's needed
+    matches = np.where(needs, ore_probabilities, 1 - ore_probabilities).prod(axis=1)
+    # Blocks that aren't replaceable never contain ores, so they are only useful when no ores are needed
+    nothing_needed = ~needs[:, :, 0].any(axis=1)
+    useful = stone * matches * (1 - lapis) + (1 - stone) * nothing_needed[:, np.newaxis]
+    return useful @ deviation_matrix.T
+
+
 def _build_ore_probability_table(needs_coal: bool, needs_iron: bool, needs_gold: bool, 
                                 needs_redstone: bool, needs_diamond: bool) -> DiscreteBayesianNetwork:
 
@@ -49,22 +132,6 @@ def _build_ore_probability_table(needs_coal: bool, needs_iron: bool, needs_gold:
                 evidence_card=[len(y_levels)]
                 )
 
-    # Distribution data obtained by scanning a 190x190 chunk area of the world 
-    # (2.36 billion blocks!) using Just Enough Resources' /jer_profile command
-
-    # Data covers y [4, 50]
-    stone_distribution = [0.6077037, 0.7576785, 0.75672805, 0.75576496, 0.7545372, 0.75285023, 0.75158334, 0.75071996, 0.749829, 0.7495794, 0.7512247, 0.7533533, 0.7529744, 0.7523656, 0.7512067, 0.75028884, 0.7503957, 0.750659, 0.7504439, 0.7498299, 0.7492808, 0.74931055, 0.7497154, 0.74971235, 0.7490319, 0.7431343, 0.7295102, 0.70669425, 0.6987211, 0.68921417, 0.6791663, 0.66926473, 0.6586811, 0.64749664, 0.63739234, 0.62882334, 0.62529266, 0.6226649, 0.6197728, 0.6151598, 0.6078381, 0.59609854, 0.58099514, 0.56244713, 0.5008914, 0.50078267, 0.5002934]
-    
-    coal_distribution = [0.010294597, 0.012933377, 0.01276096, 0.012797417, 0.012949327, 0.013002495, 0.012830838, 0.012874349, 0.012944336, 0.012968425, 0.013009114, 0.01282194, 0.01279872, 0.012808268, 0.012635525, 0.012638563, 0.01265918, 0.0124768885, 0.012380534, 0.012479275, 0.012664388, 0.0126976995, 0.012662326, 0.012603516, 0.01258724, 0.012515951, 0.0124018015, 0.0119019095, 0.011763454, 0.011582465, 0.01137793, 0.011219727, 0.011121419, 0.010969726, 0.010809896, 0.010479167, 0.010457139, 0.010566515, 0.010409071, 0.010378798, 0.010336697, 0.01009809, 0.009709202, 0.009449652, 0.008504123, 0.008467882, 0.008406467]        
-    iron_distribution = [0.0065503474, 0.008143663, 0.008125434, 0.008115235, 0.008093099, 0.008087131, 0.007998806, 0.008023546, 0.008024957, 0.007940972, 0.007948459, 0.008082357, 0.008070638, 0.007932942, 0.008031901, 0.0079934895, 0.008037435, 0.007999023, 0.007858398, 0.00790408, 0.007975261, 0.007938802, 0.007894531, 0.007944444, 0.007936306, 0.007823025, 0.00767079, 0.007390625, 0.0073261717, 0.007191623, 0.007183702, 0.0070706382, 0.0069932723, 0.0068565537, 0.006869683, 0.0066986764, 0.006562283, 0.0064863283, 0.0065120445, 0.0063182507, 0.006342882, 0.0061929254, 0.006088108, 0.0058511286, 0.005171007, 0.0051611327, 0.005294922]
-    gold_distribution = [0.0013436415, 0.0016307508, 0.0016289062, 0.0016026476, 0.001571072, 0.0015585937, 0.001584961, 0.0016157769, 0.0016050347, 0.0015330946, 0.0016294487, 0.0016286892, 0.001571506, 0.0015211588, 0.001538303, 0.0015467665, 0.001585395, 0.0016103516, 0.0015882162, 0.0015813803, 0.0015775824, 0.0015491536, 0.0015571831, 0.0015669488, 0.0015240886, 0.0014356554, 0.0008158637, 0.00022612847, 8.9735244e-05, 7.671441e-05, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
-    diamond_distribution = [0.0009611545, 0.0012084418, 0.0011835938, 0.0011832683, 0.0011921658, 0.0011842448, 0.0012052951, 0.0012259114, 0.0011788195, 0.0010817057, 0.00059082033, 9.7873264e-05, 0.0]
-    redstone_distribution = [0.0076826173, 0.009551215, 0.009431641, 0.009467773, 0.009530599, 0.009521375, 0.009644315, 0.009630642, 0.009543511, 0.0087910155, 0.004772461, 0.0007238498, 0.0]
-    lapis_distribution = [0.00029144966, 0.00044574653, 0.0005157335, 0.00054144964, 0.0006308594, 0.00069173175, 0.0007355686, 0.0008128255, 0.00086317275, 0.0009120009, 0.0009561632, 0.00088986545, 0.00080707466, 0.00075531687, 0.00071614585, 0.00065570744, 0.00059461803, 0.0005249566, 0.00046961807, 0.0004097222, 0.0003343099, 0.0002873264, 0.00022265625, 0.00014811198, 8.344184e-05, 3.4613717e-05, 4.4487847e-06, 0.0]
-    for distribution in [coal_distribution, iron_distribution, gold_distribution, diamond_distribution, redstone_distribution, lapis_distribution]:
-        if len(distribution) < len(y_levels):
-            distribution += [0] * (len(y_levels) - len(distribution))
-
     block_is_repalceable_cpd = TabularCPD(variable="block_is_replaceable",
                                           variable_card=2,
                                           state_names={"block_is_replaceable": ["True", "False"], "robot_y": y_levels},
@@ -126,19 +193,295 @@ def _build_ore_probability_table(needs_coal: bool, needs_iron: bool, needs_gold:
     return net
 
 
-def determine_optimal_depth(needs_coal: bool, needs_iron: bool, needs_gold: bool, 
-                            needs_redstone: bool, needs_diamond: bool) -> int:
+
+def _save_json(data, path: str):
+    """Write a file in full or not at all, so a crash while saving doesn't lose the previous copy"""
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w") as file:
+        json.dump(data, file)
+    os.replace(temporary_path, path)
+
+
+@functools.cache
+def _sample_mask(width: int) -> np.ndarray:
+    """Blocks of a scan centered on the robot that are close enough to count"""
+    offsets = np.arange(width) - width // 2
+    distance_squared = offsets[:, None, None]**2 + offsets[None, :, None]**2 + offsets[None, None, :]**2
+    return distance_squared <= max_sample_distance**2
+
+
+class OreDistributionEstimator:
+    """
+    Estimate of the distributions for the world the robots are actually in, combining
+    the profiled distributions with counts of the blocks robots have scanned.
+
+    The geolyzer only reads hardness, so each scanned block is counted as ore, stone, or
+    anything else (air, dirt, gravel), which isn't replaceable. At each y level those three
+    have a Dirichlet prior with prior_strength blocks' worth of weight, split according to
+    the profiled distributions. Every ore has the same hardness, so the estimate keeps the
+    profiled mix of ore types at each level, scaled to the observed amount of ore.
+
+    Attributes:
+    ore_counts: np.ndarray
+        Ore blocks scanned at each of y_levels
+    stone_counts: np.ndarray
+        Stone blocks scanned at each of y_levels
+    other_counts: np.ndarray
+        Other blocks scanned at each of y_levels
+    version: int
+        Incremented whenever blocks are counted
+    """
+
+    def __init__(self):
+        self.ore_counts = np.zeros(len(y_levels))
+        self.stone_counts = np.zeros(len(y_levels))
+        self.other_counts = np.zeros(len(y_levels))
+        self.version = 0
+        # Blocks already counted are set to 1, so overlapping scans count each block once
+        self._counted = world_map.VoxelMap()
+
+    def observe(self, center: tuple[int, int, int], view: np.ndarray):
+        """Count the blocks close to the robot in a full geolyzer scan centered on it"""
+        width = view.shape[0]
+        origin = tuple(axis - width // 2 for axis in center)
+        counted = self._counted.read(origin, view.shape)
+        level = np.arange(origin[1], origin[1] + width) - int(y_levels[0])
+        # Negative readings aren't real blocks (the simulator uses them outside of the world)
+        mask = _sample_mask(width) & np.isnan(counted) & (view >= 0)
+        mask &= ((level >= 0) & (level < len(y_levels)))[None, :, None]
+        if not mask.any():
+            return
+
+        values = view[mask]
+        levels = np.broadcast_to(level[None, :, None], view.shape)[mask]
+        is_ore = np.abs(values - ore_hardness) < hardness_tolerance
+        is_stone = np.abs(values - stone_hardness) < hardness_tolerance
+        self.ore_counts += np.bincount(levels[is_ore], minlength=len(y_levels))
+        self.stone_counts += np.bincount(levels[is_stone], minlength=len(y_levels))
+        self.other_counts += np.bincount(levels[~is_ore & ~is_stone], minlength=len(y_levels))
+
+        counted[mask] = 1
+        self._counted.write(origin, counted)
+        self.version += 1
+
+    def sample_count(self) -> int:
+        return int(self.ore_counts.sum() + self.stone_counts.sum() + self.other_counts.sum())
+
+    def distributions(self) -> tuple[np.ndarray, dict[str, np.ndarray], np.ndarray]:
+        """Posterior mean (stone, ores, lapis) distributions, in the form compute_probability_curves takes"""
+        stone_prior = np.array(stone_distribution)
+        ore_priors = {ore: np.array(distribution) for ore, distribution in ore_distributions.items()}
+        lapis_prior = np.array(lapis_distribution)
+        ore_fraction_prior = sum(ore_priors.values()) + lapis_prior
+
+        ore = prior_strength * stone_prior * ore_fraction_prior + self.ore_counts
+        stone = prior_strength * stone_prior * (1 - ore_fraction_prior) + self.stone_counts
+        other = prior_strength * (1 - stone_prior) + self.other_counts
+
+        replaceable = (ore + stone) / (ore + stone + other)
+        ore_fraction = ore / (ore + stone)
+        # Levels the profile found no ore at stay without ore, since there's no mix of types to scale
+        scale = np.divide(ore_fraction, ore_fraction_prior, out=np.ones(len(y_levels)), where=ore_fraction_prior > 0)
+        return replaceable, {ore: prior * scale for ore, prior in ore_priors.items()}, lapis_prior * scale
+
+    def save(self):
+        if ore_statistics_path is None:
+            return
+        _save_json({"y_levels": [int(y) for y in y_levels], "ore": self.ore_counts.tolist(),
+                    "stone": self.stone_counts.tolist(), "other": self.other_counts.tolist()}, ore_statistics_path)
+
+    def load(self) -> bool:
+        """Restore the counts saved by a previous run, returning False if there are none"""
+        if ore_statistics_path is None or not os.path.exists(ore_statistics_path):
+            return False
+        try:
+            with open(ore_statistics_path) as file:
+                data = json.load(file)
+            if data["y_levels"] != [int(y) for y in y_levels]:
+                return False
+            self.ore_counts = np.array(data["ore"], dtype=float)
+            self.stone_counts = np.array(data["stone"], dtype=float)
+            self.other_counts = np.array(data["other"], dtype=float)
+        except (ValueError, KeyError):
+            return False
+        self.version += 1
+        return True
+
+
+# Estimator shared by every robot, which the depth table is built from
+ore_estimator = OreDistributionEstimator()
+
+def _query_probability_curve(needs_coal: bool, needs_iron: bool, needs_gold: bool,
+                             needs_redstone: bool, needs_diamond: bool) -> list[float]:
+    """Probability of a mined block being useful when targeting each of y_levels"""
     net = _build_ore_probability_table(needs_coal, needs_iron, needs_gold, needs_redstone, needs_diamond)
     inference = VariableElimination(net)
 
+    curve = []
+    for y in y_levels:
+        query_result = inference.query(variables=["ore_is_useful"], evidence={"target_y": y})
+        curve.append(float(query_result.values[0]))  # Probability of ore_is_useful being True
+    return curve
+
+
+def _best_y_level(curve: list[float]) -> int:
     highest_probability = 0
     best_y_level = 4
 
-    for y in y_levels:
-        query_result = inference.query(variables=["ore_is_useful"], evidence={"target_y": y})
-        useful_prob = query_result.values[0]  # Probability of ore_is_useful being True
+    for y, useful_prob in zip(y_levels, curve):
         if useful_prob > highest_probability:
             highest_probability = useful_prob
-            best_y_level = y
+            best_y_level = int(y)
 
     return best_y_level
+
+
+def _table_key(needs: tuple[bool, ...]) -> str:
+    return ",".join(ore for ore, needed in zip(ore_types, needs) if needed)
+
+
+def build_depth_table(backend: str = "numpy", estimator: OreDistributionEstimator = None) -> dict:
+    """
+    Evaluate the bayes net for every combination of needed ores, using the estimator's
+    distributions if one is given and the profiled distributions otherwise.
+    Returns the table in the form it is saved to disk, to pass to set_depth_table.
+    The numpy backend takes well under a millisecond. The pgmpy backend queries the full bayes net
+    with the profiled distributions, taking a few seconds, and is kept as a reference to check the numpy version against.
+    """
+    if backend == "pgmpy":
+        curves = [_query_probability_curve(*needs) for needs in ore_combinations]
+    elif estimator is not None:
+        curves = compute_probability_curves(*estimator.distributions()).tolist()
+    else:
+        curves = compute_probability_curves(np.array(stone_distribution),
+                                            {ore: np.array(distribution) for ore, distribution in ore_distributions.items()},
+                                            np.array(lapis_distribution)).tolist()
+
+    table = {}
+    for needs, curve in zip(ore_combinations, curves):
+        table[_table_key(needs)] = {"best_y": _best_y_level(curve), "curve": curve}
+
+    samples = estimator.sample_count() if estimator is not None else 0
+    return {"version": depth_table_version, "y_levels": [int(y) for y in y_levels], "samples": samples, "table": table}
+
+
+def set_depth_table(data: dict):
+    global _depth_table
+    _depth_table = {}
+    for needs in ore_combinations:
+        entry = data["table"][_table_key(needs)]
+        _depth_table[needs] = (entry["best_y"], entry["curve"])
+
+
+def load_depth_table(samples: int = 0) -> bool:
+    """
+    Use the table saved by a previous run, returning False if it is missing or out of date.
+    samples is the number of scanned blocks the table should have been built with.
+    """
+    if depth_table_path is None or not os.path.exists(depth_table_path):
+        return False
+    try:
+        with open(depth_table_path) as file:
+            data = json.load(file)
+        if data["version"] != depth_table_version or data["y_levels"] != [int(y) for y in y_levels] or data["samples"] != samples:
+            return False
+        set_depth_table(data)
+    except (ValueError, KeyError):
+        return False
+    return True
+
+
+def save_depth_table(data: dict):
+    if depth_table_path is not None:
+        _save_json(data, depth_table_path)
+
+
+def prepare_depth_table() -> dict[tuple[bool, ...], tuple[int, list[float]]]:
+    """
+    Load the saved depth table and ore statistics, or build and save the table if it is missing or out of date.
+    Once loaded, the table is rebuilt at most every depth_table_rebuild_interval seconds as robots scan more blocks.
+    """
+    global _depth_table_estimator_version, _depth_table_build_time
+    if _depth_table is None:
+        ore_estimator.load()
+        if load_depth_table(samples=ore_estimator.sample_count()):
+            _depth_table_estimator_version = ore_estimator.version
+            return _depth_table
+    elif ore_estimator.version == _depth_table_estimator_version or time.monotonic() - _depth_table_build_time < depth_table_rebuild_interval:
+        return _depth_table
+
+    data = build_depth_table(estimator=ore_estimator)
+    set_depth_table(data)
+    save_depth_table(data)
+    ore_estimator.save()
+    _depth_table_estimator_version = ore_estimator.version
+    _depth_table_build_time = time.monotonic()
+    return _depth_table
+
+
+def determine_optimal_depth(needs_coal: bool, needs_iron: bool, needs_gold: bool, 
+                            needs_redstone: bool, needs_diamond: bool) -> int:
+    """The y level where a mined block is most likely to be one of the needed ores"""
+    return prepare_depth_table()[(needs_coal, needs_iron, needs_gold, needs_redstone, needs_diamond)][0]
+
+
+def depth_probability_curve(needs_coal: bool, needs_iron: bool, needs_gold: bool,
+                            needs_redstone: bool, needs_diamond: bool) -> dict[int, float]:
+    """Probability of a mined block being useful when targeting each y level"""
+    curve = prepare_depth_table()[(needs_coal, needs_iron, needs_gold, needs_redstone, needs_diamond)][1]
+    return {int(y): probability for y, probability in zip(y_levels, curve)}
+
+
+def useful_ore_curve(needs_coal: bool, needs_iron: bool, needs_gold: bool,
+                     needs_redstone: bool, needs_diamond: bool) -> np.ndarray:
+    """
+    Expected number of needed ores per mined block when targeting each y level.
+    The table entry for a single ore is the chance of a block being that ore, while the entries for several
+    ores require all of them in the same block, so a trip for several ores adds up their single ore curves.
+    """
+    table = prepare_depth_table()
+    curve = np.zeros(len(y_levels))
+    for index, needed in enumerate((needs_coal, needs_iron, needs_gold, needs_redstone, needs_diamond)):
+        if needed:
+            curve += table[tuple(other == index for other in range(len(ore_types)))][1]
+    return curve
+
+
+def determine_efficient_depth(needs_coal: bool, needs_iron: bool, needs_gold: bool,
+                              needs_redstone: bool, needs_diamond: bool, start_y: int,
+                              move_time: float, step_time: float, session_steps: int = mining_session_steps) -> tuple[int, float]:
+    """
+    Find the y level where a mining trip collects the most useful ore per minute, rather than the
+    most per block. A trip moves from start_y down to the target, mines for session_steps steps,
+    then climbs back up to surface_level, with each block of travel taking move_time seconds and
+    each mining step step_time seconds.
+    Returns the best y level and the useful ore per minute expected there.
+    """
+    curve = useful_ore_curve(needs_coal, needs_iron, needs_gold, needs_redstone, needs_diamond)
+    targets = np.array([int(y) for y in y_levels])
+
+    travel_blocks = np.abs(start_y - targets) + np.abs(surface_level - targets)
+    minutes = (travel_blocks * move_time + session_steps * step_time) / 60
+    ore_per_minute = session_steps * curve / minutes
+
+    best = int(np.argmax(ore_per_minute))
+    return int(targets[best]), float(ore_per_minute[best])
+
+
+if __name__ == "__main__":
+    # Check the numpy backend against the full bayes net
+    import time
+
+    start_time = time.perf_counter()
+    numpy_table = build_depth_table("numpy")
+    numpy_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    pgmpy_table = build_depth_table("pgmpy")
+    pgmpy_time = time.perf_counter() - start_time
+
+    largest_difference = max(abs(a - b) for key in numpy_table["table"]
+                             for a, b in zip(numpy_table["table"][key]["curve"], pgmpy_table["table"][key]["curve"]))
+    mismatched = [key for key in numpy_table["table"] if numpy_table["table"][key]["best_y"] != pgmpy_table["table"][key]["best_y"]]
+    print(f"numpy: {numpy_time * 1000:.2f} ms, pgmpy: {pgmpy_time * 1000:.0f} ms")
+    print(f"Largest probability difference: {largest_difference:.3g}")
+    print(f"Combinations with a different best y level: {mismatched or 'none'}")
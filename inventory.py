@@ -0,0 +1,204 @@
+"""
+Indexed model of a robot's inventory.
+
+Robots can have up to 64 slots, and the planner and actions repeatedly ask which slots hold an item,
+how much of each item there is, and where there is free space. Rather than scanning every slot for
+each question, the inventory keeps indexes that are updated whenever a slot is assigned.
+
+Each index is a bitmask of slots (bit n set for slot n), so the first matching slot is just the lowest
+set bit, and excluding the crafting grid is a single mask.
+"""
+
+import recipes
+
+# Inventory renders as 4 columns, and only the first 3 cells in each of the first 3 rows are part of the crafting grid.
+crafting_grid_slots = frozenset([1, 2, 3, 5, 6, 7, 9, 10, 11])
+crafting_grid_mask = sum(1 << slot for slot in crafting_grid_slots)
+
+
+def _lowest_slot(mask: int) -> int:
+    """The lowest slot in a mask, or -1 if it is empty"""
+    return (mask & -mask).bit_length() - 1
+
+
+def _slots_in(mask: int):
+    """Yield the slots in a mask in ascending order"""
+    while mask:
+        lowest = mask & -mask
+        yield lowest.bit_length() - 1
+        mask ^= lowest
+
+
+class Inventory:
+    """
+    The contents of each slot, as (item name, quantity) pairs or None for empty slots.
+    Indexed like a list, 1-indexed like the robot's inventory with an extra unusable None in position 0.
+
+    Attributes:
+    version: int
+        Incremented every time a slot changes, so callers can tell whether the inventory
+        has changed since they last looked at it.
+    """
+
+    version: int
+
+    def __init__(self, slots: list[tuple[str, int] | None] = None):
+        self._slots: list[tuple[str, int] | None] = [None]
+        self._item_slots: dict[str, int] = {}
+        self._totals: dict[str, int] = {}
+        self._free_slots = 0
+        # Slots holding less than a full stack, by item
+        self._partial_slots: dict[str, int] = {}
+        self._checksum = 0
+        self.version = 0
+        if slots is not None:
+            self.load(slots)
+
+    def load(self, slots: list[tuple[str, int] | None]):
+        """Replace the contents of every slot, such as after a full inventory scan"""
+        self._slots = [None]
+        self._item_slots.clear()
+        self._totals.clear()
+        self._partial_slots.clear()
+        self._checksum = 0
+        # Every slot except the unusable slot 0
+        self._free_slots = (1 << len(slots)) - 2
+        self._slots.extend([None] * (len(slots) - 1))
+        for slot, stack in enumerate(slots):
+            if slot > 0 and stack is not None:
+                self[slot] = stack
+        self.version += 1
+
+    def __getitem__(self, slot: int) -> tuple[str, int] | None:
+        return self._slots[slot]
+
+    def __setitem__(self, slot: int, stack: tuple[str, int] | None):
+        if slot <= 0:
+            raise IndexError(f"Inventory slot {slot} out of range")
+        if stack is not None and stack[1] <= 0:
+            stack = None
+
+        self._remove_from_index(slot)
+        self._slots[slot] = stack
+        bit = 1 << slot
+        if stack is None:
+            self._free_slots |= bit
+        else:
+            item, quantity = stack
+            self._free_slots &= ~bit
+            self._item_slots[item] = self._item_slots.get(item, 0) | bit
+            self._totals[item] = self._totals.get(item, 0) + quantity
+            self._checksum += slot * quantity
+            if quantity < recipes.stack_size.get(item, 64):
+                self._partial_slots[item] = self._partial_slots.get(item, 0) | bit
+        self.version += 1
+
+    def _remove_from_index(self, slot: int):
+        stack = self._slots[slot]
+        if stack is None:
+            return
+        item, quantity = stack
+        bit = 1 << slot
+        self._checksum -= slot * quantity
+        self._item_slots[item] &= ~bit
+        self._totals[item] -= quantity
+        if not self._item_slots[item]:
+            del self._item_slots[item]
+            del self._totals[item]
+        if item in self._partial_slots:
+            self._partial_slots[item] &= ~bit
+            if not self._partial_slots[item]:
+                del self._partial_slots[item]
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __iter__(self):
+        return iter(self._slots)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Inventory):
+            return self._slots == other._slots
+        return self._slots == other
+
+    def __repr__(self) -> str:
+        return f"Inventory({self._slots})"
+
+    @property
+    def size(self) -> int:
+        """Number of usable slots"""
+        return len(self._slots) - 1
+
+    def totals(self) -> dict[str, int]:
+        """Total quantity of each item held"""
+        return dict(self._totals)
+
+    def total(self, item: str) -> int:
+        return self._totals.get(item, 0)
+
+    def items(self) -> list[str]:
+        """Every item type held"""
+        return list(self._item_slots)
+
+    def slots_with(self, item: str) -> list[int]:
+        """Slots containing the item, in ascending order"""
+        return list(_slots_in(self._item_slots.get(item, 0)))
+
+    def find(self, item: str, exclude_crafting_grid=False) -> int:
+        """Return the first slot containing the item, or -1 if there is none"""
+        slots = self._item_slots.get(item, 0)
+        if exclude_crafting_grid:
+            slots &= ~crafting_grid_mask
+        return _lowest_slot(slots)
+
+    def first_empty_slot(self, exclude_crafting_grid=False) -> int:
+        """Return the first empty slot, or -1 if the inventory is full"""
+        slots = self._free_slots
+        if exclude_crafting_grid:
+            slots &= ~crafting_grid_mask
+        return _lowest_slot(slots)
+
+    def free_slot_count(self) -> int:
+        return self._free_slots.bit_count()
+
+    def partial_slots(self, item: str = None) -> list[int]:
+        """Slots holding less than a full stack, of the given item or of any item"""
+        if item is not None:
+            return list(_slots_in(self._partial_slots.get(item, 0)))
+        slots = 0
+        for item_slots in self._partial_slots.values():
+            slots |= item_slots
+        return list(_slots_in(slots))
+
+    def checksum(self) -> int:
+        """
+        Sum of each slot number multiplied by the number of items in it.
+        Matches the client's inventory_checksum command, which only reads counts so it is cheap to verify against.
+        """
+        return self._checksum
+
+    def insert(self, item: str, quantity: int, start_slot: int = 1) -> int:
+        """
+        Add items the way the robot does when it receives them, first topping up existing stacks
+        and then filling empty slots, in both cases starting at start_slot (the selected slot) and wrapping around.
+        Returns the number of items that didn't fit.
+        """
+        stack_size = recipes.stack_size.get(item, 64)
+        # Slots from start_slot onwards, then the slots before it
+        after_start = -(1 << start_slot)
+        order = lambda mask: [*_slots_in(mask & after_start), *_slots_in(mask & ~after_start)]
+
+        for slot in order(self._partial_slots.get(item, 0)):
+            moved = min(quantity, stack_size - self._slots[slot][1])
+            self[slot] = (item, self._slots[slot][1] + moved)
+            quantity -= moved
+            if quantity == 0:
+                return 0
+
+        for slot in order(self._free_slots):
+            moved = min(quantity, stack_size)
+            self[slot] = (item, moved)
+            quantity -= moved
+            if quantity == 0:
+                return 0
+        return quantity
@@ -1,11 +1,13 @@
 from textual.widgets import RichLog
 from rich.traceback import Traceback
+import multiprocessing
 import traceback
 
 _log_widget: RichLog = None
 
 try:
-    _log_file = open("autonomous-opencomputers-log.txt", "w")
+    # Worker processes (see workers.py) import this module as well, and shouldn't overwrite the server's log
+    _log_file = open("autonomous-opencomputers-log.txt", "a" if multiprocessing.parent_process() else "w")
 except PermissionError:
     print("Could not open log file (autonomous-opencomputers-log.txt): Permission Denied")
     exit(-1)
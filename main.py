@@ -10,9 +10,12 @@ from textual.reactive import reactive
 from textual.screen import Screen
 from textual.widgets import Button, Header, Input, RichLog
 
+import inference
 import logger
+import metrics
 import planner
 import webserver
+import workers
 from miner import model
 from robot import Robot
 import time
@@ -62,6 +65,11 @@ class CommandInput(Input):
             if failed:
                 logger.error("Not all robots updated successfully", "User")
             return
+        elif self.value == "stats":
+            # Network throughput from each robot, averaged over the last few seconds
+            for id, (bytes_per_second, frames_per_second) in webserver.get_throughput().items():
+                logger.info(f"Receiving {bytes_per_second / 1024:.1f} KB/s, {frames_per_second:.1f} frames/s", id)
+            return
         elif self.value == "reloadnn":
             logger.info("Reloading miner neural network", "User")
             model.load_model()
@@ -78,7 +86,7 @@ class CommandInput(Input):
 
         if command == "mine" and robot in robots:
             logger.info(f"Initiating mining action for robot {robot}", "User")
-            robots[robot].add_action(["mine"])
+            robots[robot].add_action("mine")
             task = asyncio.create_task(robots[robot].run())
             return
         if command.startswith("set") and robot in robots:
@@ -106,11 +114,14 @@ class CommandInput(Input):
         start_time = time.time()
 
         response = await webserver.send_command(robot, command)
-        data = json.loads(response)
-        if data['success']:
-            logger.info(data, robot)
+        if isinstance(response, memoryview):
+            logger.info(f"Received packed response ({len(response)} bytes)", robot)
         else:
-            logger.error(data['error'], robot)
+            data = json.loads(response)
+            if data['success']:
+                logger.info(data, robot)
+            else:
+                logger.error(data['error'], robot)
 
         end_time = time.time()
         logger.info(f"Command execution took {end_time - start_time:.2f} seconds", "Performance")
@@ -219,10 +230,99 @@ async def plan_actions(agents: dict[int, Robot]) -> bool:
         if len(actions) == 0:
             return False
         
-        for action in actions:
-            robot.add_action(action)
+        robot.add_actions(actions)
     return True
 
+async def _wait_for_any(*events: asyncio.Event):
+    """Wait until one of the events is set"""
+    tasks = [asyncio.create_task(event.wait()) for event in events]
+    await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    for task in tasks:
+        task.cancel()
+
+async def event_loop(exit_event: asyncio.Event, app: TerminalUI | None = None, plan=plan_actions):
+    """
+    Plan for and run the connected robots until exit_event is set.
+
+    :param app: The UI to notify of pause state changes. The loop runs headless without one.
+    :param plan: Fills the robots' action queues, replaceable to drive robots without the external planner.
+    """
+    def update_pause_state():
+        if app is not None:
+            app.update_pause_state()
+
+    while not exit_event.is_set():
+        try:
+            # Check for connections / disconnections
+            if webserver.connections_updated_event.is_set():
+                while webserver.removed_connections:
+                    removed_id = webserver.removed_connections.pop()
+                    robots.pop(removed_id)
+                while webserver.new_connections:
+                    new_id = webserver.new_connections.pop()
+                    robots[new_id] = Robot(new_id)
+                webserver.connections_updated_event.clear()
+
+            if pause_event.is_set() and not pause_completed_event.is_set():
+                # Manual command mode
+                # Indicates to the UI that the planner is compltely paused now, and commands can be entered
+                logger.info("Planner is now paused", "Server")
+                pause_completed_event.set()
+                update_pause_state()
+
+            elif not pause_event.is_set() and pause_completed_event.is_set():
+                # Transition from manual command mode to autonomous planner mode
+
+                # Wait for robots to finish commands initiated during manual mode
+                for agent in robots.values():
+                    agent.stop_actions()
+
+                await asyncio.gather(*[agent.ready_event.wait() for agent in robots.values()])
+                
+                pause_completed_event.clear()
+                update_pause_state()
+                logger.info("Planner resumed", "Server")
+
+            elif not pause_event.is_set() and not pause_completed_event.is_set():
+                # Autonomous planner mode
+
+                if len(robots.keys()) == 0:
+                    # Planning and waiting fails if no robots are connected, so just wait for a connection
+                    await _wait_for_any(pause_event, webserver.connections_updated_event, exit_event)
+                    continue
+                logger.info(f"Replanning with {len(robots.keys())} connected robots", "Server")
+                
+                # Populate the action queues for each robot
+                start_time = time.perf_counter()
+                found_plan = await plan(robots)
+                metrics.record("plan_actions", time.perf_counter() - start_time)
+                if not found_plan:
+                    # If planning failed there is no way it will success again without new robots or manual intervention.
+                    # Only relavent during development and testing
+                    await _wait_for_any(pause_event, webserver.connections_updated_event, exit_event)
+                    continue 
+
+                agent_tasks = [asyncio.create_task(agent.run()) for agent in robots.values()]
+                # If agents are added or removed, stop right away and replan
+                event_tasks = [asyncio.create_task(event.wait()) for event in (webserver.connections_updated_event, pause_event, exit_event)]
+                # Let the agents run until one of them completes or requires a replan
+                await asyncio.wait(agent_tasks + event_tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in event_tasks:
+                    task.cancel()
+
+                for agent in robots.values():
+                    agent.stop_actions()
+
+                await asyncio.gather(*[agent.ready_event.wait() for agent in robots.values()])
+
+            else:
+                await asyncio.sleep(0.25)
+        
+        except Exception as exception:
+            logger.exception(f"Error in main loop", exception, "Server")
+            pause_event.set()
+            update_pause_state()
+
 async def main():
     """
     Spawn the UI and planner event loop, and allow the event 
@@ -234,8 +334,11 @@ async def main():
 
     # Create the domain which defines all of the actions the planner can take
     # Unlike the problem file, this doesn't change based on the number of connected robots
-    problem = planner.create_domain()
-    open("domain.pddl", "w").write(str(problem))
+    domain = await workers.run_in_process(planner.create_domain_text)
+    open("domain.pddl", "w").write(domain)
+
+    # Best mining depth for each combination of ores, which mining actions look up on every step
+    inference.prepare_depth_table()
 
     app = TerminalUI()
     ui_task = asyncio.create_task(app.run_async())
@@ -243,79 +346,7 @@ async def main():
     await webserver.start_server()
 
     exit_event = asyncio.Event()
-    async def event_loop():
-        while not exit_event.is_set():
-            try:
-                # Check for connections / disconnections
-                if webserver.connections_updated_event.is_set():
-                    while webserver.removed_connections:
-                        removed_id = webserver.removed_connections.pop()
-                        robots.pop(removed_id)
-                    while webserver.new_connections:
-                        new_id = webserver.new_connections.pop()
-                        robots[new_id] = Robot(new_id)
-                    webserver.connections_updated_event.clear()
-
-                if pause_event.is_set() and not pause_completed_event.is_set():
-                    # Manual command mode
-                    # Indicates to the UI that the planner is compltely paused now, and commands can be entered
-                    logger.info("Planner is now paused", "Server")
-                    pause_completed_event.set()
-                    app.update_pause_state()
-
-                elif not pause_event.is_set() and pause_completed_event.is_set():
-                    # Transition from manual command mode to autonomous planner mode
-
-                    # Wait for robots to finish commands initiated during manual mode
-                    for agent in robots.values():
-                        agent.stop_actions()
-
-                    if len(robots.keys()) > 0: # wait fails if no robots are connected
-                        await asyncio.wait([agent.ready_event.wait() for agent in robots.values()])
-                    
-                    pause_completed_event.clear()
-                    app.update_pause_state()
-                    logger.info("Planner resumed", "Server")
-
-                elif not pause_event.is_set() and not pause_completed_event.is_set():
-                    # Autonomous planner mode
-
-                    if len(robots.keys()) == 0:
-                        # Planning and waiting fails if no robots are connected, so just wait for a connection
-                        await asyncio.wait([pause_event.wait(), webserver.connections_updated_event.wait(), exit_event.wait()], return_when=asyncio.FIRST_COMPLETED)
-                        continue
-                    logger.info(f"Replanning with {len(robots.keys())} connected robots", "Server")
-                    
-                    # Populate the action queues for each robot
-                    found_plan = await plan_actions(robots)
-                    if not found_plan:
-                        # If planning failed there is no way it will success again without new robots or manual intervention.
-                        # Only relavent during development and testing
-                        await asyncio.wait([pause_event.wait(), webserver.connections_updated_event.wait(), exit_event.wait()], return_when=asyncio.FIRST_COMPLETED)
-                        continue 
-
-                    agent_tasks = [asyncio.create_task(agent.run()) for agent in robots.values()]
-                    # If agents are added or removed, stop right away and replan
-                    agent_tasks.append(webserver.connections_updated_event.wait())
-                    agent_tasks.append(pause_event.wait())
-                    agent_tasks.append(exit_event.wait())
-                    # Let the agents run until one of them completes or requires a replan
-                    await asyncio.wait(agent_tasks, return_when=asyncio.FIRST_COMPLETED)
-
-                    for agent in robots.values():
-                        agent.stop_actions()
-
-                    await asyncio.gather(*[agent.ready_event.wait() for agent in robots.values()])
-
-                else:
-                    await asyncio.sleep(0.25)
-            
-            except Exception as exception:
-                logger.exception(f"Error in main loop", exception, "Server")
-                pause_event.set()
-                app.update_pause_state()
-
-    main_task = asyncio.create_task(event_loop())
+    main_task = asyncio.create_task(event_loop(exit_event, app))
 
     await ui_task
     # Try to prevent a bug where logging after the UI is closed causes an error
@@ -324,6 +355,8 @@ async def main():
     logger.info("Exiting - Please wait for current tasks for finish", "Server")
     exit_event.set()
     await main_task
+    workers.shutdown()
+    inference.ore_estimator.save()
 
 
 if __name__ == "__main__":
@@ -332,4 +365,9 @@ if __name__ == "__main__":
         model.train()
         exit()
 
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        import bench
+        bench.run_benchmark(sys.argv[2:])
+        exit()
+
     asyncio.run(main())
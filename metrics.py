@@ -0,0 +1,61 @@
+"""
+Counters and timing samples collected while the server runs, used by the benchmark
+and anywhere that needs measured timings (ie. command latency) rather than estimates.
+"""
+
+from collections import deque
+import time
+
+# Most recent samples kept for each measurement
+max_samples = 100000
+
+_samples: dict[str, deque[float]] = {}
+_counters: dict[str, int] = {}
+_start_time = time.monotonic()
+
+
+def record(name: str, value: float):
+    """Add a sample, such as the duration of a command in seconds"""
+    if name not in _samples:
+        _samples[name] = deque(maxlen=max_samples)
+    _samples[name].append(value)
+
+
+def increment(name: str, amount: int = 1):
+    _counters[name] = _counters.get(name, 0) + amount
+
+
+def count(name: str) -> int:
+    return _counters.get(name, 0)
+
+
+def samples(name: str) -> list[float]:
+    return list(_samples.get(name, []))
+
+
+def mean(name: str, default: float = 0.0) -> float:
+    values = _samples.get(name)
+    if not values:
+        return default
+    return sum(values) / len(values)
+
+
+def percentile(name: str, percent: float, default: float = 0.0) -> float:
+    """Nearest-rank percentile of the recorded samples"""
+    values = sorted(_samples.get(name, []))
+    if not values:
+        return default
+    index = min(len(values) - 1, max(0, round(percent / 100 * len(values)) - 1))
+    return values[index]
+
+
+def elapsed() -> float:
+    """Seconds since the metrics were last reset"""
+    return time.monotonic() - _start_time
+
+
+def reset():
+    global _start_time
+    _samples.clear()
+    _counters.clear()
+    _start_time = time.monotonic()
@@ -0,0 +1,83 @@
+"""
+Runs the mining model for every robot that is mining at once as a single batch.
+
+Each robot's mining step queues its geolyzer view and waits on a future. The first request
+in a batch starts a short timer, and when it expires (or the batch is full) all queued views
+are run through the model together in the worker thread pool, keeping the forward pass off
+the event loop that handles networking and the UI.
+"""
+
+import asyncio
+
+import numpy as np
+
+from miner import model
+import workers
+
+# Seconds to wait for other robots' requests after the first one arrives
+batch_window = 0.005
+# Requests beyond this start a new batch
+max_batch_size = 64
+
+
+class InferenceQueue:
+    """
+    Collects model inference requests from many robots and runs them together.
+
+    Attributes:
+    window: float
+        Seconds to wait for more requests after the first request of a batch.
+    max_batch_size: int
+        The batch is run as soon as this many requests are waiting.
+    """
+
+    def __init__(self, window: float = batch_window, max_batch_size: int = max_batch_size):
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending: list[tuple[np.ndarray, int, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+
+    async def run_one_step(self, geolyzer_view: np.ndarray, distance_from_target_y: int) -> tuple[str, bool]:
+        """Queue a view for the next batch, see model.run_model_one_step for the result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # Copied since the robot's cached view may be modified before the batch runs
+        self._pending.append((np.array(geolyzer_view, dtype=np.float32), distance_from_target_y, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._run_batch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._run_batch)
+
+        return await future
+
+    def _run_batch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        views = [view for view, _, _ in batch]
+        distances = [distance for _, distance, _ in batch]
+        futures = [future for _, _, future in batch]
+        # Any requests arriving while this batch runs form the next batch
+        task = asyncio.ensure_future(workers.run_in_thread(model.run_model_batch, views, distances))
+        task.add_done_callback(lambda task: _resolve(futures, task))
+
+
+def _resolve(futures: list[asyncio.Future], task: asyncio.Future):
+    """Pass each robot its own result, or the batch's exception"""
+    for index, future in enumerate(futures):
+        if future.cancelled():
+            continue
+        if task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result()[index])
+
+
+# Queue shared by every mining robot
+inference_queue = InferenceQueue()
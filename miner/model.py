@@ -10,6 +10,7 @@ import random
 import math
 import matplotlib
 import matplotlib.pyplot as plt
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.optim as optim
@@ -40,6 +41,12 @@ class DQN(nn.Module):
         self.fc3 = nn.Linear(257, n_actions)
 
     def forward(self, x, y_dist):
+        x = self.q_values(x, y_dist)
+        x = x.mean(dim=0, keepdim=True)  # Average the 64 channels down to 1
+        return x
+
+    def q_values(self, x, y_dist):
+        """Action values for each view in a batch, without averaging them together like forward does"""
         y_dist = torch.clamp(y_dist / 20, -1, 1)
         x = F.relu(self.conv1(x))
         x = F.relu(self.conv2(x))
@@ -49,7 +56,6 @@ class DQN(nn.Module):
         x = F.relu(self.fc2(x))
         x = torch.cat((x, y_dist.unsqueeze(1)), dim=1)
         x = self.fc3(x)
-        x = x.mean(dim=0, keepdim=True)  # Average the 64 channels down to 1
         return x
 
 Transition = namedtuple('Transition',
@@ -89,7 +95,17 @@ def load_model():
     robot_nn.load_state_dict(model_state)
     has_loaded_weights = True
 
-def run_model_one_step(geolyzer_view: list[list[list[int]]], distance_from_target_y: int) -> tuple[str, bool]:
+# Absolute direction of each action, actions 0-5 are navigation and 6-11 are mining
+action_directions = [
+    "east", # +X
+    "west", # -X
+    "up", # +Y
+    "down", # -Y
+    "south", # +Z
+    "north", # -Z
+]
+
+def run_model_one_step(geolyzer_view: np.ndarray, distance_from_target_y: int) -> tuple[str, bool]:
     """
     Use the DQN Model to select the next action a mining robot should take.
 
@@ -99,25 +115,23 @@ def run_model_one_step(geolyzer_view: list[list[list[int]]], distance_from_targe
     that direction. The direction is absolute - the model does not know its local 
     heading, and the caller is responsible for conversion and rotation the robot.
     """
+    return run_model_batch([geolyzer_view], [distance_from_target_y])[0]
 
+def run_model_batch(geolyzer_views: list[np.ndarray], distances_from_target_y: list[int]) -> list[tuple[str, bool]]:
+    """
+    Select the next action for several robots with a single forward pass.
+    Returns a (direction, should_mine) pair for each view, as described in run_model_one_step.
+    """
     if not has_loaded_weights:
         raise RuntimeError("No model loaded for NN")
 
-    view_tensor = torch.tensor(geolyzer_view, dtype=torch.float32, device=device).unsqueeze(0)
-    y_tensor = torch.tensor([distance_from_target_y], device=device)
-    action = robot_nn(view_tensor, y_tensor).max(1).indices.view(1, 1)
-
-    mapping = [
-        "east", # +X
-        "west", # -X
-        "up", # +Y
-        "down", # -Y
-        "south", # +Z
-        "north", # -Z
-    ]
-
-    # Actions 0-5 are navigation, 6-11 are mining
-    return (mapping[action % 6], action >= 6)
+    # Views are stacked into a (batch, channel, x, y, z) tensor
+    view_tensor = torch.from_numpy(np.stack(geolyzer_views).astype(np.float32, copy=False)).to(device).unsqueeze(1)
+    y_tensor = torch.tensor(distances_from_target_y, dtype=torch.float32, device=device)
+    with torch.no_grad():
+        actions = robot_nn.q_values(view_tensor, y_tensor).max(1).indices.tolist()
+
+    return [(action_directions[action % 6], action >= 6) for action in actions]
     
 
 # Model Training
@@ -327,7 +341,8 @@ def train():
     target_y = 0
     for i_episode in range(num_episodes):
         # Initialize the environment and get its state
-        env = world.World(128, 64, 128)
+        # Generated as the robot explores, so it never reaches the edge of the world
+        env = world.ChunkedWorld(64)
         target_y = random.randint(10, 50)
         robot_position = (64, 32, 64)
         print("Starting episode", i_episode)
@@ -335,7 +350,7 @@ def train():
 
         ore_mined = 0
 
-        current_state = torch.tensor(env.noisy_data_around(12, *robot_position), dtype=torch.float32, device=device).unsqueeze(0)
+        current_state = torch.from_numpy(env.noisy_data_around(12, *robot_position)).to(device).unsqueeze(0)
         for t in range(384):
             action = select_action(current_state, torch.tensor([target_y - robot_position[1]], device=device))
             new_position, observation, reward, did_mine_ore = step_environment(env, robot_position, action.item(), target_y)
@@ -344,7 +359,7 @@ def train():
             if did_mine_ore:
                 ore_mined += 1
 
-            next_state = torch.tensor(observation, dtype=torch.float32, device=device).unsqueeze(0)
+            next_state = torch.from_numpy(observation).to(device).unsqueeze(0)
 
             # Store the transition in memory
             memory.push(current_state, action, next_state, reward, torch.tensor([target_y - robot_position[1]], device=device))
@@ -3,6 +3,10 @@ Generate a very rough approximation of underground terrain from a minecraft worl
 to provide a dynamic training environment for the agent which can run faster than real-time.
 """
 
+from collections import OrderedDict
+import functools
+import itertools
+import math
 import numpy as np
 import matplotlib.pyplot as plt
 import random
@@ -26,112 +30,403 @@ block_density = {
     "bedrock": 16
 }
 
+# Side length of the cubes ore positions are grouped into for nearest ore searches
+ore_index_chunk_size = 16
+
+# Width of the columns a ChunkedWorld is generated in, and the number it keeps in memory
+column_size = 16
+max_cached_columns = 256
+# Furthest a ChunkedWorld searches for ore, in columns
+max_ore_search_columns = 8
+# Chance of a cave starting in each column, which matches the 128x128 World training used to run in
+column_cave_chance = 0.25
+# Caves carve up to 50 steps of up to 2 blocks in each direction from where they start, so they can reach this many columns away
+cave_reach_columns = 7
+# Order the kinds of feature are placed in, so the ones placed later (ie. caves) cut through the earlier ones
+feature_order = ["coal_ore", "iron_ore", "gold_ore", "diamond_ore", "redstone_ore", "dirt", "air"]
+
+# Blocks are stored as their index in this list
+block_palette = list(block_density.keys())
+block_ids = {block: index for index, block in enumerate(block_palette)}
+# Hardness of each block, indexed by block id
+density_lookup = np.array([block_density[block] for block in block_palette], dtype=np.float32)
+ore_lookup = density_lookup == 3.0
+
+
 class World:
 
     def __init__(self, x,y,z):
-        self.blocks = [[[ "stone" for _ in range(z)] for _ in range(y)] for _ in range(x)]
-        self.density = np.zeros((x,y,z))
         self.x_size = x
         self.y_size = y
         self.z_size = z
+        # The only copy of the blocks, a byte per block. Hardness is looked up from the ids as needed.
+        self.block_ids = generate_blocks(x, y, z)
+        # Ore positions in each ore_index_chunk_size cube, for chunks that have been searched
+        self._ore_chunks: dict[tuple[int, int, int], set[tuple[int, int, int]]] = {}
+        # The same positions as arrays for searching, dropped whenever the chunk's ores change
+        self._ore_arrays: dict[tuple[int, int, int], np.ndarray] = {}
 
-        for ore, attempts in [("coal_ore", 10), ("iron_ore", 5), ("gold_ore", 3), ("diamond_ore", 1), ("redstone_ore", 2)]:
-            for _ in range(attempts):
-                for chunk_x in range((x // 16)):
-                    for chunk_z in range((z // 16)):
-                        vein_position = (random.randint(0, 15), random.randint(0, y - 1), random.randint(0, 15))
-                        vein_size = random.randint(1, 4)
-                        create_sphere(self.blocks, vein_size, ore, chunk_x * 16 + vein_position[0], vein_position[1], chunk_z * 16 + vein_position[2])
-        
-        for chunk_x in range((x // 16)):
-            for chunk_z in range((z // 16)):
-                vein_position = (random.randint(0, 15), random.randint(0, y - 1), random.randint(0, 15))
-                vein_size = random.randint(3, 5)
-                create_sphere(self.blocks, vein_size, "dirt", chunk_x * 16 + vein_position[0], vein_position[1], chunk_z * 16 + vein_position[2])
-
-        # Generate some caves (number based on world size)
-        for chunk_x in range((x // 16) + (z // 16)):
-            carver_position = (random.randint(0, x), random.randint(0, y), random.randint(0, z))
-            carver_radius = random.randint(2, 5)
-            for i in range(random.randint(15, 50)):
-                carver_position = (carver_position[0] + random.randint(-2, 2),
-                                carver_position[1] + random.randint(-2, 2),
-                                carver_position[2] + random.randint(-2, 2))
-                
-                carver_radius += random.randint(-1, 1)
-                carver_radius = min(5, max(2, carver_radius))
-                
-                create_sphere(self.blocks, 2, "air", *carver_position)
-
-        for i in range(self.x_size):
-            for j in range(self.y_size):
-                for k in range(self.z_size):
-                    self.density[i][j][k] = block_density[self.blocks[i][j][k]]
-
-    def noisy_data_around(self, radius, x, y, z) -> list[list[list[float]]]:
-        """Emulate in-game Geolyzer readings for a section of the world. Noise increases with distance from the robot's position"""
-        world_slice = []
-        for i in range(x - radius, x + radius + 1):
-            world_slice.append([])
-            for j in range(y - radius, y + radius + 1):
-                world_slice[-1].append([])
-                for k in range(z - radius, z + radius + 1):
-                    x, y, z = i + radius, j + radius, k + radius
-                    distance = ((x - radius) ** 2 + (y - radius) ** 2 + (z - radius) ** 2) ** 0.5
-                    if 0 <= x < self.x_size and 0 <= y < self.y_size and 0 <= z < self.z_size:
-                        noise = (distance / 33) * 2
-                        world_slice[-1][-1].append(self.density[x][y][z] + noise)
-                    else:
-                        world_slice[-1][-1].append(block_density["bedrock"])
-        return world_slice
+    def noisy_data_around(self, radius, x, y, z) -> np.ndarray:
+        """
+        Emulate in-game Geolyzer readings for a section of the world. Noise increases with distance from the robot's position.
+        Returns a contiguous float32 array indexed [x][y][z] from the lowest corner, with bedrock outside of the world.
+        """
+        width = radius*2 + 1
+        view = np.full((width, width, width), block_density["bedrock"], dtype=np.float32)
+
+        world_slices = []
+        view_slices = []
+        for center, size in zip((x, y, z), (self.x_size, self.y_size, self.z_size)):
+            start, end = max(0, center - radius), min(size, center + radius + 1)
+            if start >= end:
+                return view
+            world_slices.append(slice(start, end))
+            view_slices.append(slice(start - (center - radius), end - (center - radius)))
+
+        view_slices = tuple(view_slices)
+        view[view_slices] = density_lookup[self.block_ids[tuple(world_slices)]]
+        view[view_slices] += noise_kernel(radius)[view_slices]
+        return view
     
 
-    def distance_to_nearest_ore(self, x, y, z):
-        """Measures the Manhatten distance to the nearest block with a density of 3."""
-        indices = np.argwhere(self.density == 3.0)
-        distances = indices.sum(axis=1)
-        nearest_index = np.argmin(distances)
-        return distances[nearest_index]
+    def _chunk_ores(self, chunk: tuple[int, int, int]) -> np.ndarray:
+        """Positions of the ore blocks in a chunk as an (n, 3) array, found the first time the chunk is searched"""
+        ores = self._ore_arrays.get(chunk)
+        if ores is not None:
+            return ores
+
+        if chunk in self._ore_chunks:
+            ores = np.array(list(self._ore_chunks[chunk]), dtype=np.int64).reshape(-1, 3)
+        else:
+            origin = np.array(chunk) * ore_index_chunk_size
+            region = self.block_ids[origin[0]:origin[0] + ore_index_chunk_size,
+                                    origin[1]:origin[1] + ore_index_chunk_size,
+                                    origin[2]:origin[2] + ore_index_chunk_size]
+            ores = np.argwhere(ore_lookup[region]) + origin
+            self._ore_chunks[chunk] = set(map(tuple, ores.tolist()))
+        self._ore_arrays[chunk] = ores
+        return ores
+
+    def distance_to_nearest_ore(self, x, y, z) -> float:
+        """
+        Measures the Manhatten distance from a position to the nearest block with a density of 3, or infinity if there are none.
+        Chunks are searched in growing shells around the position, stopping once no further chunk could hold a closer ore.
+        """
+        size = ore_index_chunk_size
+        position = (x, y, z)
+        center = (x // size, y // size, z // size)
+        chunk_counts = [(self.x_size + size - 1) // size, (self.y_size + size - 1) // size, (self.z_size + size - 1) // size]
+        # Furthest any chunk of the world can be from the position's chunk
+        max_shell = max(max(center[axis], chunk_counts[axis] - 1 - center[axis]) for axis in range(3))
+
+        nearest = math.inf
+        for shell in range(max(0, max_shell) + 1):
+            # Blocks in this shell are at least (shell - 1) * size + 1 blocks away along one axis
+            if nearest <= (shell - 1) * size:
+                break
+            ranges = [range(max(0, center[axis] - shell), min(chunk_counts[axis], center[axis] + shell + 1)) for axis in range(3)]
+            for chunk in itertools.product(*ranges):
+                if max(abs(chunk[axis] - center[axis]) for axis in range(3)) != shell:
+                    continue
+                # Distance to the closest corner or face of the chunk
+                lower_bound = sum(max(chunk[axis] * size - position[axis], 0, position[axis] - (chunk[axis] * size + size - 1)) for axis in range(3))
+                if lower_bound >= nearest:
+                    continue
+                ores = self._chunk_ores(chunk)
+                if len(ores):
+                    nearest = min(nearest, int(np.abs(ores - position).sum(axis=1).min()))
+        return nearest
 
     def sample_block(self, x, y, z) -> str:
         """String name of a block at a given position"""
         if 0 <= x < self.x_size and 0 <= y < self.y_size and 0 <= z < self.z_size:
-            return self.blocks[x][y][z]
+            return block_palette[self.block_ids[x, y, z]]
         return "bedrock"
     
     def sample_density(self, x, y, z) -> float:
         """Get the (not noisy) block hardness from a given position"""
         if 0 <= x < self.x_size and 0 <= y < self.y_size and 0 <= z < self.z_size:
-            return self.density[x][y][z]
+            return float(density_lookup[self.block_ids[x, y, z]])
         return 16
 
+    def sample_densities(self, x: np.ndarray, y: np.ndarray, z: np.ndarray) -> np.ndarray:
+        """Hardness of many blocks at once as float32, for arrays of positions inside the world"""
+        return density_lookup[self.block_ids[x, y, z]]
+
+    @property
+    def density(self) -> np.ndarray:
+        """Hardness of every block. Builds a new array on each use, so prefer the other accessors where possible."""
+        return density_lookup[self.block_ids]
+
     def dig(self, x, y, z):
+        self.set_block(x, y, z, "air")
+
+    def set_block(self, x, y, z, block: str):
         if 0 <= x < self.x_size and 0 <= y < self.y_size and 0 <= z < self.z_size:
-            self.blocks[x][y][z] = "air"
-            self.density[x][y][z] = 0.0
+            self.block_ids[x, y, z] = block_ids[block]
+            chunk = (x // ore_index_chunk_size, y // ore_index_chunk_size, z // ore_index_chunk_size)
+            ores = self._ore_chunks.get(chunk)
+            if ores is not None:
+                if ore_lookup[block_ids[block]]:
+                    ores.add((x, y, z))
+                else:
+                    ores.discard((x, y, z))
+                self._ore_arrays.pop(chunk, None)
+
+
+
+class ChunkedWorld:
+    """
+    A world without horizontal bounds, generated a 16x16 column (the full height of the world) at
+    a time as it is first used. Each column's features are chosen from a seed derived from the world's
+    seed and its position, and features that cross into other columns are placed in those too, so there
+    are no seams between columns. Columns dropped from the cache regenerate identically, with any blocks
+    changed in them reapplied. Like World, positions above or below the world read as bedrock.
+    """
+
+    def __init__(self, y_size: int = 64, seed: int = None):
+        self.y_size = y_size
+        self.seed = seed if seed is not None else random.randrange(2**32)
+        # Generated columns by column position (x // column_size, z // column_size), least recently used first
+        self._columns: OrderedDict[tuple[int, int], np.ndarray] = OrderedDict()
+        # Blocks set in each column, as position within the column to block id
+        self._changes: dict[tuple[int, int], dict[tuple[int, int, int], int]] = {}
+        # Positions of the ore blocks in each cached column, dropped whenever the column's ores change
+        self._ore_arrays: dict[tuple[int, int], np.ndarray] = {}
+
+    def _column(self, column_x: int, column_z: int) -> np.ndarray:
+        """Block ids of a column, indexed [x][y][z] within it, generating it if it isn't cached"""
+        key = (column_x, column_z)
+        column = self._columns.get(key)
+        if column is not None:
+            self._columns.move_to_end(key)
+            return column
+
+        column = self._generate_column(column_x, column_z)
+        for position, block_id in self._changes.get(key, {}).items():
+            column[position] = block_id
+
+        self._columns[key] = column
+        while len(self._columns) > max_cached_columns:
+            evicted, _ = self._columns.popitem(last=False)
+            self._ore_arrays.pop(evicted, None)
+        return column
+
+    def _generate_column(self, column_x: int, column_z: int) -> np.ndarray:
+        """
+        Place every feature that reaches into the column, including those from neighbouring columns' seeds,
+        so veins, pockets and caves continue across column edges. Features are placed in a fixed order
+        (by kind like World, then by the column that placed them) so overlapping features agree between columns.
+        """
+        x_start, z_start = column_x * column_size, column_z * column_size
+        x_end, z_end = x_start + column_size - 1, z_start + column_size - 1
+
+        placed = []
+        for other_x in range(column_x - cave_reach_columns, column_x + cave_reach_columns + 1):
+            for other_z in range(column_z - cave_reach_columns, column_z + cave_reach_columns + 1):
+                veins, caves = _column_features(self.seed, other_x, other_z, self.y_size)
+                # Veins and pockets start inside their own column and are small enough to only reach the adjacent ones
+                nearby = abs(other_x - column_x) <= 1 and abs(other_z - column_z) <= 1
+                for index, feature in enumerate(veins + caves if nearby else caves):
+                    block, radius, centers, low_x, high_x, low_z, high_z = feature
+                    if low_x <= x_end and high_x >= x_start and low_z <= z_end and high_z >= z_start:
+                        placed.append((feature_order.index(block), other_x, other_z, index, block, radius, centers))
+
+        column = np.full((column_size, self.y_size, column_size), block_ids["stone"], dtype=np.uint8)
+        placed.sort(key=lambda entry: entry[:4])
+        for _, _, _, _, block, radius, centers in placed:
+            for x, y, z in centers:
+                create_sphere(column, radius, block, x - x_start, y, z - z_start)
+        return column
+
+    def _read_ids(self, origin: tuple[int, int, int], shape: tuple[int, int, int]) -> np.ndarray:
+        """Block ids of a box of the world, which may span several columns"""
+        ids = np.full(shape, block_ids["bedrock"], dtype=np.uint8)
+        y_start, y_end = max(0, origin[1]), min(self.y_size, origin[1] + shape[1])
+        if y_start >= y_end:
+            return ids
+
+        for column_x in range(origin[0] // column_size, (origin[0] + shape[0] - 1) // column_size + 1):
+            for column_z in range(origin[2] // column_size, (origin[2] + shape[2] - 1) // column_size + 1):
+                column = self._column(column_x, column_z)
+                x_start, x_end = max(origin[0], column_x * column_size), min(origin[0] + shape[0], (column_x + 1) * column_size)
+                z_start, z_end = max(origin[2], column_z * column_size), min(origin[2] + shape[2], (column_z + 1) * column_size)
+                ids[x_start - origin[0]:x_end - origin[0], y_start - origin[1]:y_end - origin[1], z_start - origin[2]:z_end - origin[2]] = \
+                    column[x_start - column_x * column_size:x_end - column_x * column_size, y_start:y_end,
+                           z_start - column_z * column_size:z_end - column_z * column_size]
+        return ids
+
+    def noisy_data_around(self, radius, x, y, z) -> np.ndarray:
+        """See World.noisy_data_around"""
+        width = radius*2 + 1
+        view = density_lookup[self._read_ids((x - radius, y - radius, z - radius), (width, width, width))]
+        # Only blocks within the world's height are noisy, matching World
+        y_start, y_end = max(0, radius - y), min(width, self.y_size - y + radius)
+        if y_start < y_end:
+            view[:, y_start:y_end] += noise_kernel(radius)[:, y_start:y_end]
+        return view
+
+    def _column_ores(self, column_x: int, column_z: int) -> np.ndarray:
+        """Positions of the ore blocks in a column as an (n, 3) array of world coordinates"""
+        ores = self._ore_arrays.get((column_x, column_z))
+        if ores is None:
+            ores = np.argwhere(ore_lookup[self._column(column_x, column_z)]) + (column_x * column_size, 0, column_z * column_size)
+            self._ore_arrays[(column_x, column_z)] = ores
+        return ores
+
+    def distance_to_nearest_ore(self, x, y, z) -> float:
+        """
+        Measures the Manhatten distance from a position to the nearest block with a density of 3, or infinity if there
+        are none within max_ore_search_columns columns. Columns are searched in growing rings around the position.
+        """
+        center = (x // column_size, z // column_size)
+        nearest = math.inf
+        for ring in range(max_ore_search_columns + 1):
+            # Blocks in this ring are at least (ring - 1) * column_size + 1 blocks away horizontally
+            if nearest <= (ring - 1) * column_size:
+                break
+            for column_x in range(center[0] - ring, center[0] + ring + 1):
+                for column_z in range(center[1] - ring, center[1] + ring + 1):
+                    if max(abs(column_x - center[0]), abs(column_z - center[1])) != ring:
+                        continue
+                    lower_bound = max(column_x * column_size - x, 0, x - (column_x * column_size + column_size - 1)) + \
+                                  max(column_z * column_size - z, 0, z - (column_z * column_size + column_size - 1))
+                    if lower_bound >= nearest:
+                        continue
+                    ores = self._column_ores(column_x, column_z)
+                    if len(ores):
+                        nearest = min(nearest, int(np.abs(ores - (x, y, z)).sum(axis=1).min()))
+        return nearest
+
+    def sample_block(self, x, y, z) -> str:
+        """String name of a block at a given position"""
+        if 0 <= y < self.y_size:
+            return block_palette[self._column(x // column_size, z // column_size)[x % column_size, y, z % column_size]]
+        return "bedrock"
+
+    def sample_density(self, x, y, z) -> float:
+        """Get the (not noisy) block hardness from a given position"""
+        if 0 <= y < self.y_size:
+            return float(density_lookup[self._column(x // column_size, z // column_size)[x % column_size, y, z % column_size]])
+        return 16
+
+    def dig(self, x, y, z):
+        self.set_block(x, y, z, "air")
+
+    def set_block(self, x, y, z, block: str):
+        if 0 <= y < self.y_size:
+            key = (x // column_size, z // column_size)
+            position = (x % column_size, y, z % column_size)
+            self._column(*key)[position] = block_ids[block]
+            self._changes.setdefault(key, {})[position] = block_ids[block]
+            self._ore_arrays.pop(key, None)
+
+def generate_features(x, y, z, rng: random.Random = random, cave_count: int = None) -> list[tuple[str, int, list[tuple[int, int, int]]]]:
+    """
+    Choose the ore veins, dirt pockets and caves of a world, in the order they are placed.
+    The number of caves is based on the world size unless cave_count is given.
+    Each feature is (block, radius, sphere centers). Veins and pockets are a single sphere,
+    and caves are a chain of spheres along the path of the carver.
+    """
+    features = []
+
+    for ore, attempts in [("coal_ore", 10), ("iron_ore", 5), ("gold_ore", 3), ("diamond_ore", 1), ("redstone_ore", 2)]:
+        for _ in range(attempts):
+            for chunk_x in range((x // 16)):
+                for chunk_z in range((z // 16)):
+                    vein_position = (rng.randint(0, 15), rng.randint(0, y - 1), rng.randint(0, 15))
+                    vein_size = rng.randint(1, 4)
+                    features.append((ore, vein_size, [(chunk_x * 16 + vein_position[0], vein_position[1], chunk_z * 16 + vein_position[2])]))
+
+    for chunk_x in range((x // 16)):
+        for chunk_z in range((z // 16)):
+            vein_position = (rng.randint(0, 15), rng.randint(0, y - 1), rng.randint(0, 15))
+            vein_size = rng.randint(3, 5)
+            features.append(("dirt", vein_size, [(chunk_x * 16 + vein_position[0], vein_position[1], chunk_z * 16 + vein_position[2])]))
+
+    # Generate some caves (number based on world size)
+    if cave_count is None:
+        cave_count = (x // 16) + (z // 16)
+    for _ in range(cave_count):
+        carver_position = (rng.randint(0, x), rng.randint(0, y), rng.randint(0, z))
+        carver_radius = rng.randint(2, 5)
+        path = []
+        for i in range(rng.randint(15, 50)):
+            carver_position = (carver_position[0] + rng.randint(-2, 2),
+                            carver_position[1] + rng.randint(-2, 2),
+                            carver_position[2] + rng.randint(-2, 2))
+            
+            carver_radius += rng.randint(-1, 1)
+            carver_radius = min(5, max(2, carver_radius))
+            
+            path.append(carver_position)
+        features.append(("air", 2, path))
+
+    return features
+
+
+def generate_blocks(x, y, z, rng: random.Random = random) -> np.ndarray:
+    """Generate the block ids of a world, with ore veins, dirt pockets and caves carved out of stone"""
+    blocks = np.full((x, y, z), block_ids["stone"], dtype=np.uint8)
+    for block, radius, centers in generate_features(x, y, z, rng):
+        for center in centers:
+            create_sphere(blocks, radius, block, *center)
+    return blocks
+
+
+@functools.lru_cache(maxsize=4096)
+def _column_features(seed: int, column_x: int, column_z: int, y_size: int) -> tuple[list, list]:
+    """
+    The features a ChunkedWorld column's seed places, in world coordinates, split into (veins and pockets, caves).
+    Each is (block, radius, sphere centers, lowest x, highest x, lowest z, highest z) with the bounds of every sphere.
+    """
+    # String seeds are hashed the same way on every run, unlike tuples of negative numbers
+    rng = random.Random(f"{seed}:{column_x}:{column_z}")
+    veins, caves = [], []
+    cave_count = 1 if rng.random() < column_cave_chance else 0
+    for block, radius, centers in generate_features(column_size, y_size, column_size, rng, cave_count):
+        centers = [(column_x * column_size + x, y, column_z * column_size + z) for x, y, z in centers]
+        xs, zs = [x for x, _, _ in centers], [z for _, _, z in centers]
+        feature = (block, radius, centers, min(xs) - radius, max(xs) + radius, min(zs) - radius, max(zs) + radius)
+        (caves if block == "air" else veins).append(feature)
+    return veins, caves
+
+
+@functools.cache
+def noise_kernel(radius: int) -> np.ndarray:
+    """Geolyzer noise at each position of a scan of the given radius, which grows with distance from the center"""
+    offsets = np.arange(-radius, radius + 1)
+    distance = np.sqrt(offsets[:, None, None]**2 + offsets[None, :, None]**2 + offsets[None, None, :]**2)
+    kernel = ((distance / 33) * 2).astype(np.float32)
+    kernel.flags.writeable = False
+    return kernel
+
+
+@functools.cache
+def sphere_mask(radius: int) -> np.ndarray:
+    """Boolean mask of the blocks within a sphere, indexed [x][y][z] from the corner of its bounding cube"""
+    offsets = np.arange(-radius, radius + 1)
+    distance_squared = offsets[:, None, None]**2 + offsets[None, :, None]**2 + offsets[None, None, :]**2
+    return distance_squared < radius**2
 
 
-def create_sphere(world, radius, block, center_x, center_y, center_z):
-    x, y, z = len(world), len(world[0]), len(world[0][0])
+def create_sphere(blocks: np.ndarray, radius, block, center_x, center_y, center_z):
+    """Fill a sphere of a block id array with a block, clipped to the array's bounds"""
+    world_slices = []
+    mask_slices = []
+    for center, size in zip((center_x, center_y, center_z), blocks.shape):
+        start, end = max(0, center - radius), min(size, center + radius + 1)
+        if start >= end:
+            return
+        world_slices.append(slice(start, end))
+        mask_slices.append(slice(start - (center - radius), end - (center - radius)))
 
-    for i in range(-radius, radius + 1):
-        for j in range(-radius, radius + 1):
-            for k in range(-radius, radius + 1):
-                if (i**2 + j**2 + k**2) < radius**2:
-                    block_x = center_x + i
-                    block_y = center_y + j
-                    block_z = center_z + k
-                    if 0 <= block_x < x and 0 <= block_y < y and 0 <= block_z < z:
-                        world[block_x][block_y][block_z] = block
+    blocks[tuple(world_slices)][sphere_mask(radius)[tuple(mask_slices)]] = block_ids[block]
 
 
 def render_density(world: World):
     """Render a generated world for visual debugging"""
-    data = np.zeros((world.x_size, world.y_size, world.z_size))
-    for i in range(world.x_size):
-        for j in range(world.y_size):
-            for k in range(world.z_size):
-                data[i][j][k] = block_density.get(world.blocks[i][j][k], 0.0)
+    data = world.density
 
     fig = plt.figure(figsize=(6, 6))
     ax = fig.add_subplot(projection="3d")
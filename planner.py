@@ -19,9 +19,13 @@ from pddl.action import Action
 from pddl.requirements import Requirements
 import asyncio
 from datetime import datetime
+import itertools
 import logger
+from inventory import Inventory
+import metrics
 from recipes import recipe_ingredients, recipes, items_list, stack_size
 from robot import Robot
+import workers
 
 # Number of slots completely filled with a specific item.
 full_stack_functions = {
@@ -53,6 +57,16 @@ should_update_item_stacks = Predicate("should_update_item_stacks")()
 cost_function = NumericFunction("cost")()
 
 desired_ore_predicates = {ore: Predicate(f"needs_{ore}")() for ore in ["coal", "iron", "gold", "redstone", "diamond"] }
+# Every set of ores a single mining trip can be sent for, in the same order as desired_ore_predicates
+ore_combinations = [
+    combination
+    for count in range(1, len(desired_ore_predicates) + 1)
+    for combination in itertools.combinations(desired_ore_predicates.keys(), count)
+]
+# Cost of one trip mining a stack of each ore in a combination, set from how long robots are expected to take in each problem
+mine_cost_functions = {ores: NumericFunction(f"mine_cost_{'_'.join(ores)}")() for ores in ore_combinations}
+# Planner cost of each minute a robot is expected to spend mining, on top of the mine action's fixed cost
+mine_cost_per_minute = 0.01
 
 def create_domain() -> Domain:
     actions = []
@@ -323,10 +337,21 @@ def create_domain() -> Domain:
                     desired_ore_predicates[ore],
                     And(
                         Increase(full_stack_functions[ore], NumericValue(1)),
-                        Not(desired_ore_predicates[ore])
+                        Not(desired_ore_predicates[ore]),
                     )
                 )
                 for ore in desired_ore_predicates.keys()
+            ],
+            # One trip collects every needed ore at once, so it is charged once for the whole set
+            *[
+                effects.When(
+                    And(*[
+                        desired_ore_predicates[ore] if ore in ores else Not(desired_ore_predicates[ore])
+                        for ore in desired_ore_predicates.keys()
+                    ]),
+                    Increase(cost_function, mine_cost_functions[ores])
+                )
+                for ores in ore_combinations
             ]
         )
     ))
@@ -383,6 +408,7 @@ def create_domain() -> Domain:
             full_stack_functions.values(),
             partial_stack_functions.values(),
             non_stackable_items_functions.values(),
+            mine_cost_functions.values(),
             [inventory_size_function, inventory_slots_used_function, cost_function]
         ] for function in function_list},
         predicates=[should_update_item_stacks, *desired_ore_predicates.values()]
@@ -391,12 +417,13 @@ def create_domain() -> Domain:
     return domain
 
 
-def create_problem(item_quantities: dict[str, int], inventory_size: int, goal_item: str) -> Problem:
+def create_problem(item_quantities: dict[str, int], inventory_size: int, goal_item: str, mine_costs: dict[tuple[str, ...], float]) -> Problem:
     """
     Create a PDDL problem from a dictionary of robots and their inventories.
     
     :param robots: A dictionary of robot ids and their inventories, 
                    represented as a dictionary of item names and quantities.
+    :param mine_costs: The cost of a trip mining each combination of ores, from mining_costs.
     :return: A PDDL Problem with the goal of creating a new robot.
     """
     initial_state = []
@@ -428,6 +455,9 @@ def create_problem(item_quantities: dict[str, int], inventory_size: int, goal_it
     for predicate in desired_ore_predicates.values():
         initial_state.append(Not(predicate))
 
+    for ores, cost in mine_costs.items():
+        initial_state.append(EqualTo(mine_cost_functions[ores], NumericValue(round(cost, 2))))
+
     goal = None
     target_amount = item_quantities.get(goal_item, 0) + 1
     if stack_size[goal_item] > 1:
@@ -446,6 +476,26 @@ def create_problem(item_quantities: dict[str, int], inventory_size: int, goal_it
 
     return problem
 
+def create_problem_text(item_quantities: dict[str, int], inventory_size: int, goal_item: str, mine_costs: dict[tuple[str, ...], float]) -> str:
+    """Write the problem as PDDL. Run in a worker process, since building it is slow."""
+    return str(create_problem(item_quantities, inventory_size, goal_item, mine_costs))
+
+def mining_costs(robot: Robot) -> dict[tuple[str, ...], float]:
+    """
+    Planner cost of the robot making one trip for a stack of each ore in every combination, from the useful ore
+    per minute it is expected to collect at the best depth for the whole combination, so the mine action reflects
+    measured command timings and the robot's position.
+    """
+    costs = {}
+    for ores in ore_combinations:
+        _, ore_per_minute = robot.mining_estimate(list(ores))
+        costs[ores] = sum(stack_size.get(ore, 64) for ore in ores) / max(ore_per_minute, 0.001) * mine_cost_per_minute
+    return costs
+
+def create_domain_text() -> str:
+    """Write the domain as PDDL. Run in a worker process, since building it is slow."""
+    return str(create_domain())
+
 
 def determine_goal(robot: Robot) -> str:
     """Based on the robot's inventory, determine which item the planner should pursue next"""
@@ -515,8 +565,8 @@ async def replan(robot: Robot) -> list[str]:
     if goal_item == "robot":
         return ["create_robot"]
 
-    problem = create_problem(robot.count_items(), len(robot.inventory) - 1, goal_item)
-    open("problem.pddl", "w").write(str(problem))
+    problem = await workers.run_in_process(create_problem_text, robot.count_items(), len(robot.inventory) - 1, goal_item, mining_costs(robot))
+    open("problem.pddl", "w").write(problem)
 
     start_time = datetime.now()
     process = await asyncio.create_subprocess_shell(
@@ -529,6 +579,7 @@ async def replan(robot: Robot) -> list[str]:
 
     end_time = datetime.now()
     duration = end_time - start_time
+    metrics.record("replan", duration.total_seconds())
 
     if "Found Plan" in output:
         logger.info(f"Found plan in {duration.total_seconds():.2f} seconds", "Planner")
@@ -568,7 +619,7 @@ if __name__ == "__main__":
     domain = create_domain()
 
     robot = Robot(1)
-    robot.inventory = [
+    robot.inventory = Inventory([
         None,
         ("plank", 43),
         ("diamond", 23),
@@ -596,7 +647,7 @@ if __name__ == "__main__":
         None,
         None,
         None,
-    ]
+    ])
 
     open("domain.pddl", "w").write(str(domain))
     
@@ -1,12 +1,51 @@
 import asyncio
+import functools
 import json
+import math
+import time
 from typing import Literal
+import numpy as np
 import inference
 import logger
-from miner import model
+import metrics
+from miner import batched_inference
+from inventory import Inventory, crafting_grid_slots
 from recipes import convert_item_name
 import recipes
 import webserver
+import world_map
+
+# Number of locally predicted inventory changes (ie. crafts) between comparing the
+# mirror against a checksum from the robot. Set to 0 to trust predictions without checking.
+inventory_checksum_interval = 1
+
+# Number of incremental (single face) geolyzer scans before the whole volume is scanned again,
+# refreshing the geolyzer noise and any changes made by other robots
+full_scan_interval = 16
+
+# Seconds to dig and move one block, and for one step of the mining model,
+# used to choose a mining depth until there are measurements
+default_move_time = 0.5
+default_mining_step_time = 1.5
+
+# Moves of one block along an axis. After these, _scan_slab shifts the cached scan and
+# only scans the newly exposed face, as a one block thick scan_region.
+single_block_moves = frozenset([(1, 0, 0), (-1, 0, 0), (0, 1, 0), (0, -1, 0), (0, 0, 1), (0, 0, -1)])
+
+@functools.cache
+def scan_tile_shape(shape: tuple[int, int, int]) -> tuple[int, int, int]:
+    """
+    Size of the tiles to scan a region in with the fewest geolyzer.scan calls, each of which returns at most 64 blocks.
+    A 25^3 cube takes 300 calls of 1x7x9, compared to 625 when scanning one column at a time.
+    """
+    best_calls, best_tile = None, None
+    for width in range(1, min(shape[0], 64) + 1):
+        for height in range(1, min(shape[1], 64 // width) + 1):
+            depth = min(shape[2], 64 // (width * height))
+            calls = math.ceil(shape[0] / width) * math.ceil(shape[1] / height) * math.ceil(shape[2] / depth)
+            if best_calls is None or calls < best_calls:
+                best_calls, best_tile = calls, (width, height, depth)
+    return best_tile
 
 class Robot:
     """
@@ -15,9 +54,9 @@ class Robot:
     Attributes:
     id: int
         The robot's unique identifier, stored on the robot itself to aid in restoring state.
-    inventory: list
-        A list of item name and quantity pairs, representing the robot's inventory.
-        The list is 1-indexed, with an extra unusable None in position 0.
+    inventory: Inventory
+        Item name and quantity pairs for each slot, representing the robot's inventory.
+        It is 1-indexed, with an extra unusable None in position 0.
     position: tuple
         The in-world position of the robot. It has no native coordinate access, so this is tracked manually.
     direction: str
@@ -25,18 +64,29 @@ class Robot:
     """
 
     id: int
-    inventory: list[tuple[str, int] | None]
+    inventory: Inventory
     position: tuple[int, int, int]
     direction: Literal["north", "east", "south", "west"]
 
     def __init__(self, id, position=None, direction=None):
         self.id = id
-        self.inventory = []
+        self.inventory = Inventory()
         self.position = position or (0, 0, 0)
         self.direction = direction or "north"
+        # Identifies the client's inventory change tracking, and how many changes have been mirrored
+        self.inventory_session = None
+        self.inventory_generation = 0
+        self.predictions_since_verified = 0
+        # Inventory version when stacks were last consolidated
+        self.consolidated_version = None
         
         self.desired_ores = []
 
+        # Most recent geolyzer scan, kept up to date as the robot moves by scanning only the newly exposed face
+        self.scan_cache: np.ndarray | None = None
+        self.scan_cache_position = None
+        self.scans_since_full = 0
+
         self.action_queue = asyncio.Queue()
         self.current_action = None
         # Indicates to the planner that the robot has completed its actions
@@ -48,11 +98,11 @@ class Robot:
         self.ready_event.clear()
         try:
             while not self.action_queue.empty():
-                # Actions queued are in the form of a list of strings,
-                # where the first entry is the pddl function name and any further entries are arguments.
-                action_name = self.action_queue.get_nowait()
-                logger.info(f"Executing action {action_name}", self.id)
-                self.current_action = _action_from_name(action_name, robot=self)
+                # Actions are queued as the pddl action name, paired with the
+                # number of times to repeat it when consecutive identical crafts were merged.
+                action_name, count = self.action_queue.get_nowait()
+                logger.info(f"Executing action {action_name}" + (f" x{count}" if count > 1 else ""), self.id)
+                self.current_action = _action_from_name(action_name, robot=self, count=count)
                 success = await self.current_action.run()
 
                 self.current_action = None
@@ -63,8 +113,22 @@ class Robot:
             logger.exception(f"Error in robot action queue", e, self.id)
         self.ready_event.set()
 
-    def add_action(self, action):
-        self.action_queue.put_nowait(action)
+    def add_action(self, action: str, count: int = 1):
+        self.action_queue.put_nowait((action, count))
+
+    def add_actions(self, actions: list[str]):
+        """
+        Queue a plan's actions, merging runs of the same craft so the
+        crafting grid is set up once for all of them.
+        """
+        index = 0
+        while index < len(actions):
+            count = 1
+            if actions[index].startswith("craft_"):
+                while index + count < len(actions) and actions[index + count] == actions[index]:
+                    count += 1
+            self.add_action(actions[index], count)
+            index += count
 
     def stop_actions(self):
         """
@@ -86,33 +150,71 @@ class Robot:
             logger.error(f"Move: {data['error']}", self.id)
             return False
         
-        # Update recorded position
+        self._record_move(side)
+        return True
+
+    async def dig_and_move(self, side: Literal["front", "up", "down"]) -> bool:
+        """
+        Mine the block on one side of the robot if there is one, and move into its place.
+        Both commands are sent as a single batch to save a round trip.
+        """
+        if side not in ["front", "up", "down"]:
+            logger.error(f"Invalid side for digging: {side}", self.id)
+            return False
+
+        start_time = time.perf_counter()
+        # Swinging fails when there is nothing to mine, which shouldn't stop the move
+        results = await webserver.send_batch(self.id, [f"?swing {side}", f"move {side}"])
+        if len(results) < 2 or not results[-1]["success"]:
+            logger.error(f"Move: {results[-1]['error']}", self.id)
+            return False
+
+        metrics.record("dig_and_move", time.perf_counter() - start_time)
+        self._record_move(side)
+        return True
+
+    def _record_move(self, side: Literal["front", "left", "right", "back", "up", "down"]):
+        """Update the tracked position after a successful move"""
+        self.position = self.adjacent_position(side)
+        # The robot is standing in the space, so it must be empty
+        self.mark_empty(self.position)
+
+    def mark_empty(self, position: tuple[int, int, int]):
+        """Record that a block is now air (ie. after mining it), in the shared map and cached scan"""
+        world_map.shared_map.set(*position, world_map.air)
+        if self.scan_cache is not None:
+            radius = self.scan_cache.shape[0] // 2
+            index = tuple(position[axis] - self.scan_cache_position[axis] + radius for axis in range(3))
+            if all(0 <= i < self.scan_cache.shape[0] for i in index):
+                self.scan_cache[index] = world_map.air
+
+    def adjacent_position(self, side: Literal["front", "left", "right", "back", "up", "down"]) -> tuple[int, int, int]:
+        """Position of the block on the given side of the robot"""
         x,y,z = self.position
         if side == "up":
-            self.position = (x, y + 1, z)
+            return (x, y + 1, z)
         elif side == "down":
-            self.position = (x, y - 1, z)
-        else:
-            moved_direction = ""
-            if side == "front":
-                moved_direction = self.direction
-            elif side == "back":
-                moved_direction = left_of(left_of(self.direction))
-            elif side == "left":
-                moved_direction = left_of(self.direction)
-            elif side == "right":
-                moved_direction = right_of(self.direction)
-            
-            if moved_direction == "north":
-                self.position = (x, y, z - 1)
-            elif moved_direction == "south":
-                self.position = (x, y, z + 1)
-            elif moved_direction == "west":
-                self.position = (x - 1, y, z)
-            elif moved_direction == "east":
-                self.position = (x + 1, y, z)
-
-        return True
+            return (x, y - 1, z)
+
+        moved_direction = ""
+        if side == "front":
+            moved_direction = self.direction
+        elif side == "back":
+            moved_direction = left_of(left_of(self.direction))
+        elif side == "left":
+            moved_direction = left_of(self.direction)
+        elif side == "right":
+            moved_direction = right_of(self.direction)
+        
+        if moved_direction == "north":
+            return (x, y, z - 1)
+        elif moved_direction == "south":
+            return (x, y, z + 1)
+        elif moved_direction == "west":
+            return (x - 1, y, z)
+        elif moved_direction == "east":
+            return (x + 1, y, z)
+        return self.position
 
     async def turn_to_face(self, direction: str) -> bool:
         """Turn to face one of the caridinal directions."""
@@ -152,8 +254,29 @@ class Robot:
     async def update_inventory(self) -> bool:
         """
         Update the robot's inventory to reflect the in-world state.
-        This is polled rather than automatic, scanning the entire inventory
-        takes a relatively long time compared to other operations.
+        The client tracks which slots have changed, so after the first full scan
+        only the changed slots are sent. Falls back to a full scan whenever
+        the client has restarted since the inventory was last synced.
+        """
+        if self.inventory_session is not None:
+            response = await webserver.send_command(self.id, f"inventory_delta {self.inventory_generation}")
+            data = json.loads(response)
+            if not data["success"]:
+                logger.error(f"Update Inventory: {data['error']}", self.id)
+                return False
+
+            if data["session"] == self.inventory_session and data["size"] + 1 == len(self.inventory):
+                for slot, item in data["changes"].items():
+                    self.inventory[int(slot)] = _stack_from_json(item)
+                self.inventory_generation = data["generation"]
+                return True
+
+        return await self.rescan_inventory()
+
+    async def rescan_inventory(self) -> bool:
+        """
+        Replace the inventory mirror with a full scan of every slot.
+        Scanning the entire inventory takes a relatively long time compared to other operations.
         """
         response = await webserver.send_command(self.id, "inventory")
         data = json.loads(response)
@@ -165,49 +288,64 @@ class Robot:
         inv = [None] * (data["size"] + 1)
 
         for slot, item in data["inventory"].items():
-            slot = int(slot)
-            # Many modded items in-game share the same ID due to a hard cap 
-            # on the number of valid IDs in old Minecraft versions.
-            # These items are differentiated by their data value.
-            item_name = convert_item_name(item["name"], item["dataValue"])
-            inv[slot] = (item_name, item["count"])
-
-        self.inventory = inv
+            inv[int(slot)] = _stack_from_json(item)
+
+        self.inventory.load(inv)
+        # Older clients don't track changes, and will always be fully rescanned
+        self.inventory_session = data.get("session")
+        self.inventory_generation = data.get("generation", 0)
         return True
 
+    async def verify_inventory(self) -> bool:
+        """
+        Called after predicting the effect of a command on the inventory rather than rescanning.
+        Periodically compares the prediction with a checksum of the robot's real inventory,
+        and rescans the whole inventory if they differ.
+        """
+        self.predictions_since_verified += 1
+        if inventory_checksum_interval <= 0 or self.predictions_since_verified < inventory_checksum_interval:
+            return True
+        self.predictions_since_verified = 0
+
+        response = await webserver.send_command(self.id, "inventory_checksum")
+        data = json.loads(response)
+        if data["success"] and data["checksum"] == self.inventory.checksum():
+            return True
+
+        logger.info("Predicted inventory differs from the robot, rescanning", self.id)
+        # A wrong prediction may have changed slots that the robot didn't, which a delta wouldn't correct
+        return await self.rescan_inventory()
+
     def count_items(self) -> dict[str, int]:
         """
         Robot inventory tracks individual slot contents, 
         the planner just needs to know total quantities.
         """
-        counts = {}
-        for item, quantity in [slot for slot in self.inventory if slot is not None]:
-            if item in counts:
-                counts[item] += quantity
-            else:
-                counts[item] = quantity
-        return counts
+        return self.inventory.totals()
+
+    def mining_estimate(self, ores: list[str]) -> tuple[int, float]:
+        """
+        The y level where mining for the ores collects the most per minute, starting from the robot's
+        position and using the measured time to move and run mining steps, and the ore per minute there.
+        """
+        move_time = metrics.mean("dig_and_move", default_move_time)
+        step_time = metrics.mean("mining_step", default_mining_step_time)
+        return inference.determine_efficient_depth(*[ore in ores for ore in inference.ore_types],
+                                                   self.position[1], move_time, step_time)
 
     def first_empty_slot(self, exclude_crafting_grid=False) -> int:
         """
         Return the index of the first empty slot in the robot's inventory.
         If exclude_crafting_grid is True, the 3x3 area in the top left of the inventory is ignored.
         """
-        for i, slot in enumerate(self.inventory[1:]):
-            # Inventory renders as 4 columns, and only the first 3 cells in each row are part of the crafting grid.
-            if slot is None and not (exclude_crafting_grid and i < 12 and i%4 < 3):
-                return i+1
-        return -1
+        return self.inventory.first_empty_slot(exclude_crafting_grid)
 
     def find_item(self, item: str, exclude_crafting_grid=False) -> int:
         """
         Return the index of the first slot containing the specified item.
         If exclude_crafting_grid is True, the 3x3 area in the top left of the inventory is ignored.
         """
-        for i, slot in enumerate(self.inventory[1:]):
-            if slot and slot[0] == item and not (exclude_crafting_grid and i < 12 and i%4 < 3):
-                return i+1
-        return -1
+        return self.inventory.find(item, exclude_crafting_grid)
 
     async def consolidate_stacks(self) -> bool:
         """
@@ -216,35 +354,53 @@ class Robot:
         by having no more than one stack of an item type that isn't full.
         Returns whether the operation was successful.
         """
-        partial_stacks = {number: contents for number, contents in enumerate(self.inventory) if contents and contents[1] < recipes.stack_size.get(contents[0], 64)}
-
-        while len(partial_stacks) > 0:
-            slot, stack = partial_stacks.popitem()
-
-            destination_slot = None
-            for other_slot, other_stack in partial_stacks.items():
-                if other_slot != slot and stack[0] == other_stack[0]:
-                    destination_slot = other_slot
-                    break
-            
-            if destination_slot is None:
-                continue
+        if self.consolidated_version == self.inventory.version:
+            # Nothing has changed since the inventory was last consolidated
+            return True
 
-            success = await self.transfer_items(slot, destination_slot)
-            partial_stacks[destination_slot] = self.inventory[destination_slot]
-            if not success:
+        moves = self.plan_consolidation()
+        if moves:
+            commands = [f"transfer {source} {dest} {quantity}" for source, dest, quantity in moves]
+            results = await webserver.send_batch(self.id, commands)
+            if len(results) < len(commands) or not results[-1]["success"]:
                 # Robot networking or client code failed, give up and the caller should return to the planner
-                logger.error(f"Failed to consolidate stacks in slots {slot} and {destination_slot}", self.id)
+                logger.error(f"Failed to consolidate stacks: {results[-1].get('error')}", self.id)
+                await self.rescan_inventory()
                 return False
-            
-            # If anything was left in the source stack, it means the destination was filled by the transfer.
-            # Ignore the destination slot from now on, and find try to find somewhere else for the remainder.
-            if self.inventory[slot] is not None:
-                partial_stacks.pop(destination_slot)
-                partial_stacks[slot] = self.inventory[slot]            
 
+            for source, dest, quantity in moves:
+                self.predict_transfer(source, dest, quantity)
+
+        self.consolidated_version = self.inventory.version
         return True
-    
+
+    def plan_consolidation(self) -> list[tuple[int, int, int]]:
+        """
+        Determine the transfers (source, destination, quantity) that leave at most one partial stack of each item.
+        For each item, the fullest partial stacks are topped up from the emptiest ones. Every transfer
+        either fills its destination or empties its source, so n partial stacks take at most n-1 transfers.
+        """
+        moves = []
+        for item in self.inventory.items():
+            slots = self.inventory.partial_slots(item)
+            if len(slots) < 2:
+                continue
+
+            stack_size = recipes.stack_size.get(item, 64)
+            counts = {slot: self.inventory[slot][1] for slot in slots}
+            slots.sort(key=lambda slot: counts[slot], reverse=True)
+            fill, take = 0, len(slots) - 1
+            while fill < take:
+                quantity = min(stack_size - counts[slots[fill]], counts[slots[take]])
+                moves.append((slots[take], slots[fill], quantity))
+                counts[slots[fill]] += quantity
+                counts[slots[take]] -= quantity
+                if counts[slots[take]] == 0:
+                    take -= 1
+                if counts[slots[fill]] == stack_size:
+                    fill += 1
+        return moves
+
     async def transfer_items(self, source_slot: int, dest_slot: int, quantity: int = None) -> bool:
         """
         Transfer items from one inventory slot to another.
@@ -263,11 +419,19 @@ class Robot:
             logger.error(f"Transfer: {data['error']}", self.id)
             return False
 
+        self.predict_transfer(source_slot, dest_slot, quantity)
+        return True
+
+    def predict_transfer(self, source_slot: int, dest_slot: int, quantity: int = None):
+        """
+        Simulate the effect of a transfer command on the robot to maintain consistent
+        inventory state without making the expensive call to update_inventory.
+        """
         source_stack = self.inventory[source_slot]
         dest_stack = self.inventory[dest_slot]
-        # TODO: Thoroughly verify correctness
-        # Simulate the action taken by the command on the robot to maintain consistent
-        # inventory state without making the expensive call to update_inventory.
+        if source_stack is None:
+            return
+
         if dest_stack is None:
             if quantity is None or quantity > source_stack[1]:
                 self.inventory[dest_slot] = source_stack
@@ -276,7 +440,7 @@ class Robot:
                 self.inventory[source_slot] = (source_stack[0], source_stack[1] - quantity)
                 self.inventory[dest_slot] = (source_stack[0], quantity)
 
-        elif source_stack is not None:
+        else:
             if quantity is None and source_stack[0] != dest_stack[0]:
                 self.inventory[source_slot], self.inventory[dest_slot] = dest_stack, source_stack
 
@@ -285,12 +449,10 @@ class Robot:
                 amount_to_move = min(quantity or source_stack[1], source_stack[1])
                 if remaining_space >= amount_to_move:
                     self.inventory[dest_slot] = (dest_stack[0], dest_stack[1] + amount_to_move)
-                    self.inventory[source_slot] = None
+                    self.inventory[source_slot] = (source_stack[0], source_stack[1] - amount_to_move)
                 else:
                     self.inventory[dest_slot] = (dest_stack[0], dest_stack[1] + remaining_space)
                     self.inventory[source_slot] = (source_stack[0], source_stack[1] - remaining_space)
-        # elif source_stack is None: no-op
-        return True
 
     async def drop_unrecognized_items(self) -> bool:
         """
@@ -298,15 +460,15 @@ class Robot:
         Unknown items can't be counted towards the total used inventory space in PDDL, 
         so they should be discarded before running the planner.
         """
-        for i, slot in enumerate(self.inventory):
-            if slot and slot[0] not in recipes.items_list:
-                logger.info(f"Discarding unknown item {slot[0]} in slot {i}", self.id)
-                await webserver.send_command(self.id, f"select {i}")
-                response = await webserver.send_command(self.id, "drop 64")
-                logger.info(f"{response}", self.id)
-                data = json.loads(response)
-                if not data["success"]:
-                    logger.error(f"Drop: Failed to drop unknown item {self.item}", self.id)
+        for item in self.inventory.items():
+            if item in recipes.items_list:
+                continue
+            for i in self.inventory.slots_with(item):
+                logger.info(f"Discarding unknown item {item} in slot {i}", self.id)
+                results = await webserver.send_batch(self.id, [f"select {i}", "drop 64"])
+                logger.info(f"{results[-1]}", self.id)
+                if len(results) < 2 or not results[-1]["success"]:
+                    logger.error(f"Drop: Failed to drop unknown item {item}", self.id)
                     return False
                 self.inventory[i] = None
         return True
@@ -314,38 +476,133 @@ class Robot:
     def __str__(self) -> str:
         return f"Robot {self.id} at {self.position} facing {self.direction}"
 
-    async def use_geolyzer(self, radius) -> list[list[list[int]]]:
-        """Read the block hardness in the area around the robot"""
+    async def use_geolyzer(self, radius) -> np.ndarray | None:
+        """
+        Read the block hardness in the area around the robot.
+        Returns a float32 array indexed [x][y][z], or None if the scan failed.
 
-        response = await webserver.send_command(self.id, f"scan {radius}")
-        data = json.loads(response)
-        if not data["success"]:
-            logger.error(f"Geolyzer: {data['error']}", self.id)
-            return []
-        
-        # Parse the json containing a 3d array of data.
-        # The client's small json helper isn't capable of generating array syntax,
-        # so it uses standard objects with numeric keys
-        table = [None] * (radius*2 + 1)
-        for x, y_slice_dict in data["data"].items():
-            x_entry = [None] * (radius*2 + 1)
-            for y, z_slice_dict in y_slice_dict.items():
-                z_entry = [None] * (radius*2 + 1)
-                for z, hardness in z_slice_dict.items():
-                    z_entry[int(z)] = hardness
-                x_entry[int(y)] = z_entry
-            
-            table[int(x)] = x_entry
-
-        return table
+        When the robot has moved a single block since its last scan, only the newly exposed face
+        is scanned and the rest is shifted over from the previous scan. Otherwise the scan starts from
+        the shared map, and only the blocks no robot has scanned yet are read from the geolyzer.
+        Every full_scan_interval scans the whole area is scanned again, to refresh it.
+        """
+        width = radius*2 + 1
+        movement = None
+        if self.scan_cache is not None and self.scan_cache.shape[0] == width and self.scans_since_full < full_scan_interval:
+            movement = tuple(self.position[axis] - self.scan_cache_position[axis] for axis in range(3))
+
+        if movement == (0, 0, 0):
+            self.scans_since_full += 1
+            return self.scan_cache
+        elif movement in single_block_moves:
+            view = await self._scan_slab(radius, movement)
+        elif self.scan_cache is not None and self.scans_since_full >= full_scan_interval:
+            view = await self._scan_full(radius)
+        else:
+            view = await self._scan_unknown(radius)
+
+        if view is None:
+            self.scan_cache = None
+            return None
+
+        self.scan_cache = view
+        self.scan_cache_position = self.position
+        world_map.shared_map.write(tuple(axis - radius for axis in self.position), view)
+        return view
+
+    async def _scan_full(self, radius) -> np.ndarray | None:
+        view = await self.scan_region((-radius, -radius, -radius), (radius*2 + 1,) * 3)
+        if view is None:
+            return None
+        self.scans_since_full = 0
+        # Every block of a full scan was read from the robot's current position, so the close
+        # ones are accurate enough to learn the ore distributions from
+        inference.ore_estimator.observe(self.position, view)
+        return view
+
+    async def _scan_unknown(self, radius) -> np.ndarray | None:
+        """Read the area from the shared map, and scan the smallest box covering the blocks it doesn't know"""
+        view = world_map.shared_map.read_around(self.position, radius)
+        unknown = np.argwhere(np.isnan(view))
+        if len(unknown) == view.size:
+            return await self._scan_full(radius)
+
+        if len(unknown):
+            lower = unknown.min(axis=0)
+            upper = unknown.max(axis=0) + 1
+            region = await self.scan_region(tuple(int(i) - radius for i in lower), tuple(int(i) for i in upper - lower))
+            if region is None:
+                return None
+            view[tuple(slice(start, end) for start, end in zip(lower, upper))] = region
+        self.scans_since_full += 1
+        return view
+
+    async def _scan_slab(self, radius, movement: tuple[int, int, int]) -> np.ndarray | None:
+        """Shift the cached scan to follow a one block move, and fill in the new face with a one block thick scan_region"""
+        width = radius*2 + 1
+        axis = [abs(step) for step in movement].index(1)
+        offset, shape = [-radius] * 3, [width] * 3
+        offset[axis], shape[axis] = movement[axis] * radius, 1
+        # Another robot may have already scanned the new face
+        slab = world_map.shared_map.read(tuple(self.position[i] + offset[i] for i in range(3)), tuple(shape))
+        if np.isnan(slab).any():
+            slab = await self.scan_region(tuple(offset), tuple(shape))
+            if slab is None:
+                return None
+
+        # Everything in the cached view moves one block against the direction of travel
+        source = [slice(None)] * 3
+        destination = [slice(None)] * 3
+        face = [slice(None)] * 3
+        if movement[axis] > 0:
+            source[axis], destination[axis], face[axis] = slice(1, None), slice(0, -1), slice(-1, None)
+        else:
+            source[axis], destination[axis], face[axis] = slice(0, -1), slice(1, None), slice(0, 1)
+
+        view = np.empty_like(self.scan_cache)
+        view[tuple(destination)] = self.scan_cache[tuple(source)]
+        view[tuple(face)] = slab
+        self.scans_since_full += 1
+        return view
+
+    async def scan_region(self, offset: tuple[int, int, int], shape: tuple[int, int, int]) -> np.ndarray | None:
+        """
+        Read the hardness of a box starting at an offset from the robot.
+        Returns a float32 array indexed [x][y][z], or None if the scan failed.
+        """
+        tile = scan_tile_shape(shape)
+        response = await webserver.send_command(self.id, f"scan_region {' '.join(map(str, offset + shape + tile))}")
+        if isinstance(response, str):
+            data = json.loads(response)
+            logger.error(f"Geolyzer: {data.get('error', 'Expected a packed scan response')}", self.id)
+            return None
+
+        expected_size = shape[0] * shape[1] * shape[2] * 4
+        if len(response) != expected_size:
+            logger.error(f"Geolyzer: Packed scan has {len(response)} bytes, expected {expected_size}", self.id)
+            return None
+
+        # Tiles arrive one after another as little-endian float32 values, each in the order the
+        # geolyzer returns them (x changing fastest, then z, then y)
+        values = np.frombuffer(response, dtype="<f4")
+        view = np.empty(shape, dtype=np.float32)
+        index = 0
+        for x in range(0, shape[0], tile[0]):
+            for y in range(0, shape[1], tile[1]):
+                for z in range(0, shape[2], tile[2]):
+                    width, height, depth = min(tile[0], shape[0] - x), min(tile[1], shape[1] - y), min(tile[2], shape[2] - z)
+                    size = width * height * depth
+                    view[x:x + width, y:y + height, z:z + depth] = values[index:index + size].reshape(height, depth, width).transpose(2, 0, 1)
+                    index += size
+        return view
 
     async def empty_crafting_grid(self) -> bool:
         for i in range(1, 13):
-            if (i-1) % 4 < 3 and (self.robot.inventory[i] is not None):
-                dest_index = self.robot.first_empty_slot(exclude_crafting_grid=True)
-                success = await self.robot.transfer_items(i, dest_index)
+            if (i-1) % 4 < 3 and (self.inventory[i] is not None):
+                dest_index = self.first_empty_slot(exclude_crafting_grid=True)
+                success = await self.transfer_items(i, dest_index)
                 if not success:
-                    logger.error(f"Failed to clear crafting grid (moving slot {i} to {dest_index})", self.robot.id)
+                    logger.error(f"Failed to clear crafting grid (moving slot {i} to {dest_index})", self.id)
                     return False
         return True
 
@@ -396,22 +653,30 @@ class WaitAction(Action):
 
 
 class CraftAction(Action):
-    """Craft an item using the robot's crafting upgrade."""
+    """
+    Craft an item using the robot's crafting upgrade.
+    Repeated crafts of the same item are done together, filling the crafting grid
+    with as many of each ingredient as possible and crafting them all at once.
+    """
 
-    def __init__(self, robot: Robot, item: str):
+    def __init__(self, robot: Robot, item: str, count: int = 1):
         super().__init__(robot)
         self.item = item
+        self.count = count
 
     async def run(self) -> bool:
-        # TODO: Syncing inventories is slow, so we should only do it when necessary
-        await self.robot.update_inventory()
+        # Other actions (smelting, mining, collecting items) change the inventory without
+        # updating the mirror, so sync it first. Only the changed slots are sent.
+        # From here on the mirror is kept up to date by predicting the effect of each craft.
+        if not await self.robot.update_inventory():
+            return False
 
         # Check if the robot has the required materials
         required_items = recipes.recipe_ingredients[self.item]
         items = self.robot.count_items()
         for ingredient, quantity in required_items.items():
-            if ingredient not in items or items[ingredient] < quantity:
-                logger.error(f"Missing {ingredient} required to craft {self.item}", self.robot.id)
+            if ingredient not in items or items[ingredient] < quantity * self.count:
+                logger.error(f"Missing {ingredient} required to craft {self.count} {self.item}", self.robot.id)
                 return False
 
         # Clear the top left corner of the inventory
@@ -419,31 +684,67 @@ class CraftAction(Action):
         if not success:
             return False
 
-        # Place the ingredients in the correct slots for crafting
         recipe_data = recipes.recipes[self.item]
+        # Each grid cell can only hold one stack. The output is also limited to one stack, so that it
+        # all lands in the selected slot rather than overflowing into the crafting grid.
+        output_stack_size = recipes.stack_size.get(self.item, 64)
+        max_crafts_per_round = min([recipes.stack_size.get(ingredient, 64) for ingredient in required_items] + [max(1, output_stack_size // recipe_data["output"])])
+
+        remaining = self.count
+        while remaining > 0:
+            crafts = min(remaining, max_crafts_per_round)
+            if not await self.craft(recipe_data, crafts):
+                return False
+            remaining -= crafts
+
+        return await self.robot.verify_inventory()
+
+    async def craft(self, recipe_data: dict, crafts: int) -> bool:
+        """Place enough ingredients in the grid for the given number of crafts, and craft them."""
+        # Plan the transfers against the inventory mirror, so each ingredient
+        # can be gathered from several partial stacks, and send them in one batch.
+        commands = []
         for row in range(3):
             for col in range(3):
                 ingredient = recipe_data["recipe"][row][col]
-                if ingredient:
+                if not ingredient:
+                    continue
+                dest_index = row*4 + (col+1) # Crafting grid uses 3 of the 4 columns in the inventory grid
+                needed = crafts
+                while needed > 0:
                     source_index = self.robot.find_item(ingredient, exclude_crafting_grid=True)
-                    dest_index = row*4 + (col+1) # Crafting grid uses 3 of the 4 columns in the inventory grid
-                    success = await self.robot.transfer_items(source_index, dest_index, 1)
-                    if not success:
-                        logger.error(f"Failed to place {ingredient} in crafting grid", self.robot.id)
+                    if source_index == -1:
+                        logger.error(f"Not enough {ingredient} to fill crafting grid", self.robot.id)
+                        await self.robot.rescan_inventory()
                         return False
-
-        # Craft the item
-        dest_slot = self.robot.find_item(self.item, exclude_crafting_grid=True)
+                    quantity = min(needed, self.robot.inventory[source_index][1])
+                    commands.append(f"transfer {source_index} {dest_index} {quantity}")
+                    self.robot.predict_transfer(source_index, dest_index, quantity)
+                    needed -= quantity
+
+        # Craft the item, selecting where the output should go so its placement can be predicted
+        produced = crafts * recipe_data["output"]
+        space = recipes.stack_size.get(self.item, 64) - produced
+        partial_slots = [slot for slot in self.robot.inventory.partial_slots(self.item)
+                         if slot not in crafting_grid_slots and self.robot.inventory[slot][1] <= space]
+        dest_slot = partial_slots[0] if partial_slots else self.robot.first_empty_slot(exclude_crafting_grid=True)
         dest_slot = 1 if dest_slot == -1 else dest_slot
-        await webserver.send_command(self.robot.id, f"select {dest_slot}")
-        response = await webserver.send_command(self.robot.id, "craft")
-        data = json.loads(response)
-        if not data["success"]:
-            logger.error(f"Failed to craft {self.item}: {data['error']}", self.robot.id)
+        # The count is of items produced, not of crafting operations
+        commands += [f"select {dest_slot}", f"craft {produced}"]
+
+        results = await webserver.send_batch(self.robot.id, commands)
+        if len(results) < len(commands) or not results[-1]["success"]:
+            logger.error(f"Failed to craft {self.item}: {results[-1].get('error')}", self.robot.id)
+            # The predicted transfers may not all have happened
+            await self.robot.rescan_inventory()
             return False
 
-        # TODO: Probably don't need this since anywhere that accesses it already refreshes first
-        await self.robot.update_inventory()
+        # Apply the craft to the inventory mirror: the crafted amount of each ingredient is consumed from the grid
+        for slot in crafting_grid_slots:
+            stack = self.robot.inventory[slot]
+            if stack is not None:
+                self.robot.inventory[slot] = (stack[0], stack[1] - crafts)
+        self.robot.inventory.insert(self.item, produced, dest_slot)
         return True
 
 
@@ -463,22 +764,21 @@ class SmeltAction(Action):
             return False
 
         # Place a furnace and load the items and fuel into it
-        await webserver.send_command(self.robot.id, f"select {self.robot.find_item('furnace')}")
-        await webserver.send_command(self.robot.id, "place front")
-
-        await webserver.send_command(self.robot.id, f"select {self.robot.find_item(self.item)}")
-        await webserver.send_command(self.robot.id, "insert front 1 8")
-
-        await webserver.send_command(self.robot.id, f"select {self.robot.find_item('coal')}")
-        await webserver.send_command(self.robot.id, "insert front 2 1")
+        await webserver.send_batch(self.robot.id, [
+            f"select {self.robot.find_item('furnace')}",
+            "place front",
+            f"select {self.robot.find_item(self.item)}",
+            "insert front 1 8",
+            f"select {self.robot.find_item('coal')}",
+            "insert front 2 1",
+        ])
 
         # A furnace takes 80 seconds to cook 8 items
         await asyncio.sleep(85)
 
         # Collect the finished product
         # TODO: Don't abandon the furnace
-        await webserver.send_command(self.robot.id, f"select 1")
-        await webserver.send_command(self.robot.id, "take front 3")
+        await webserver.send_batch(self.robot.id, ["select 1", "take front 3"])
 
         return True
 
@@ -493,23 +793,20 @@ class DropAction(Action):
     async def run(self) -> bool:
         stack_size = recipes.stack_size.get(self.item, 64)
         slot_number = None
-        for index, slot in enumerate(self.robot.inventory):
-            if slot and slot[0] == self.item:
-                if self.full_stack and slot[1] == stack_size:
-                    slot_number = index
-                    break
-                elif not self.full_stack and slot[1] < stack_size:
-                    slot_number = index
-                    break
+        if self.full_stack:
+            partial_slots = self.robot.inventory.partial_slots(self.item)
+            full_slots = [slot for slot in self.robot.inventory.slots_with(self.item) if slot not in partial_slots]
+            slot_number = full_slots[0] if full_slots else None
+        else:
+            partial_slots = self.robot.inventory.partial_slots(self.item)
+            slot_number = partial_slots[0] if partial_slots else None
 
         if not slot_number:
             logger.error(f"Drop: {self.item} not found in inventory", self.robot.id)
             return False
         
-        await webserver.send_command(self.robot.id, f"select {slot_number}")
-        response = await webserver.send_command(self.robot.id, f"drop 64")
-        data = json.loads(response)
-        if not data["success"]:
+        results = await webserver.send_batch(self.robot.id, [f"select {slot_number}", "drop 64"])
+        if len(results) < 2 or not results[-1]["success"]:
             logger.error(f"Drop: Failed to drop {'full' if self.full_stack else 'partial'} stack of {self.item}", self.robot.id)
             return False
         
@@ -520,8 +817,6 @@ class DropAction(Action):
 class MineAction(Action):
 
     async def run(self) -> bool:
-        ideal_y = 30 # TODO: Replace with runtime-calculated optimal height for desired resources
-
         # Unlike a player, The robot can't mine stone without a pickaxe.
         # It is important that we keep a spare for escaping to surface once mining is done.
         inventory_contents = self.robot.count_items()
@@ -548,19 +843,26 @@ class MineAction(Action):
             logger.error("Failed to equip pickaxe", self.robot.id)
             return False
 
+        if override_depth:
+            target_y = 40
+        else:
+            # Chosen once per trip, since the travel time is counted from where the robot starts
+            target_y, ore_per_minute = self.robot.mining_estimate(self.robot.desired_ores)
+            logger.info(f"Mining at y={target_y}, expecting {ore_per_minute:.2f} useful ore per minute", self.robot.id)
+
         # Descend to ideal mining depth
-        while self.robot.position[1] >= ideal_y:
-            await webserver.send_command(self.robot.id, "swing down")
-            success = await self.robot.move("down")
+        while self.robot.position[1] > target_y:
+            success = await self.robot.dig_and_move("down")
             if not success:
-                logger.error(f"Failed to reach target depth of y={ideal_y}", self.robot.id)
+                logger.error(f"Failed to reach target depth of y={target_y}", self.robot.id)
                 return False
 
         # Mine directed by the neural network until the pickaxe runs out of durability
         # Inventory is checked periodically to discard excess stone and unknown items
         done = False
-        next_inventory_check_countdown = self.robot.inventory.count(None) - 1
+        next_inventory_check_countdown = self.robot.inventory.free_slot_count()
         while not done:
+            step_start_time = time.perf_counter()
             response = await webserver.send_command(self.robot.id, "durability")
             data = json.loads(response)
             if self.cancel_event.is_set() or (not data["success"] and data["error"] == "no tool equipped"):
@@ -570,21 +872,24 @@ class MineAction(Action):
 
             geolyzer_view = await self.robot.use_geolyzer(12)
 
-            if geolyzer_view == []:
+            if geolyzer_view is None:
                 logger.error("Failed to read geolyzer data", self.robot.id)
                 done = True
+                continue
 
-            ores = self.robot.desired_ores
-            y_level = inference.determine_optimal_depth("coal" in ores, "iron" in ores, "gold" in ores, "redstone" in ores, "diamond" in ores) if not override_depth else 40
-            direction, should_mine = model.run_model_one_step(geolyzer_view, y_level)
+            # Batched with the other mining robots' steps, and run off the event loop
+            direction, should_mine = await batched_inference.inference_queue.run_one_step(geolyzer_view, target_y - self.robot.position[1])
 
+            metrics.increment("mining_steps")
             logger.info(f"Action: {direction}, {'mining' if should_mine else 'move'}", self.robot.id)
             if direction != "up" and direction != "down":
                 await self.robot.turn_to_face(direction)
 
             facing = direction if direction == "up" or direction == "down" else "front"
             if should_mine:
-                await webserver.send_command(self.robot.id, f"swing {facing}")
+                response = await webserver.send_command(self.robot.id, f"swing {facing}")
+                if json.loads(response)["success"]:
+                    self.robot.mark_empty(self.robot.adjacent_position(facing))
             else:
                 await self.robot.move(facing)
 
@@ -602,9 +907,10 @@ class MineAction(Action):
                 # Assuming that every minable block drops one type of item, in the worst case a 
                 # number of mining actions equal to the number of free slots can be run without 
                 # worrying about not having space for drops. 
-                next_inventory_check_countdown = self.robot.inventory.count(None) - 1
+                next_inventory_check_countdown = self.robot.inventory.free_slot_count()
 
             next_inventory_check_countdown -= 1
+            metrics.record("mining_step", time.perf_counter() - step_start_time)
 
         self.robot.desired_ores.clear()
 
@@ -622,8 +928,7 @@ class MineAction(Action):
             return False
 
         while True:
-            await webserver.send_command(self.robot.id, "swing up")
-            success = await self.robot.move("up")
+            success = await self.robot.dig_and_move("up")
             if not success:
                 # TODO: robot.move does not state reason for failure. Assume that far 
                 #       enough above sea level a failed upwards movement means the 
@@ -635,13 +940,11 @@ class MineAction(Action):
                 # isn't touching the side of another block. Digging a verticle tunnel its 
                 # usually fine, but running into a cave requires extra work to escape 
                 while not success:
-                    await webserver.send_command(self.robot.id, "swing front")
-                    success = await self.robot.move("front")
+                    success = await self.robot.dig_and_move("front")
                     if success:
                         break
 
-                    await webserver.send_command(self.robot.id, "swing down")
-                    await self.robot.move("down")
+                    await self.robot.dig_and_move("down")
                     
 
         return True
@@ -726,8 +1029,7 @@ class AssembleRobotAction(Action):
 
         async def insert(item, dest_slot):
             slot = self.robot.find_item(item)
-            await webserver.send_command(self.robot.id, f"select {slot}")
-            await webserver.send_command(self.robot.id, f"insert front {dest_slot} 1")
+            await webserver.send_batch(self.robot.id, [f"select {slot}", f"insert front {dest_slot} 1"])
 
         # Load items into assembler
         slot = self.robot.find_item("assembler")
@@ -824,7 +1126,16 @@ class AssembleRobotAction(Action):
         return True
 
 
-def _action_from_name(action_name: str, robot: Robot) -> Action:
+def _stack_from_json(item: dict | bool) -> tuple[str, int] | None:
+    """Convert a slot sent by the client to an inventory entry. Emptied slots are sent as false."""
+    if not item:
+        return None
+    # Many modded items in-game share the same ID due to a hard cap 
+    # on the number of valid IDs in old Minecraft versions.
+    # These items are differentiated by their data value.
+    return (convert_item_name(item["name"], item["dataValue"]), item["count"])
+
+def _action_from_name(action_name: str, robot: Robot, count: int = 1) -> Action:
     if action_name.startswith("smelt_8_"):
         item = action_name.split("_", 2)[-1]
         return SmeltAction(robot, item, True)
@@ -834,7 +1145,7 @@ def _action_from_name(action_name: str, robot: Robot) -> Action:
     
     elif action_name.startswith("craft_"):
         item = action_name.split("_", 1)[-1]
-        return CraftAction(robot, item)
+        return CraftAction(robot, item, count)
     
     elif action_name.startswith("discard_stack_"):
         item = action_name.split("_", 2)[-1]
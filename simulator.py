@@ -0,0 +1,639 @@
+"""
+Simulated robots that stand in for client.lua, speaking the same protocol to the server.
+
+Each robot acts on a shared miner.world.World and an in-memory inventory instead of a Minecraft
+world, allowing the networking layer, action queue and planner loop to be exercised (and load tested)
+without the game. Network latency and geolyzer noise are configurable.
+
+Run standalone with `python simulator.py --robots 10` while the server is running.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+
+import numpy as np
+
+from miner import world
+import recipes
+
+client_version = "sim"
+
+# Item dropped when mining each block type
+block_drops = {
+    "stone": ("cobblestone", 1),
+    "coal_ore": ("coal", 1),
+    "iron_ore": ("iron_ore", 1),
+    "gold_ore": ("gold_ore", 1),
+    "diamond_ore": ("diamond", 1),
+    "redstone_ore": ("redstone", 4),
+    "lapis_ore": ("lapis", 6),
+    "emerald_ore": ("emerald", 1),
+    "dirt": ("dirt", 1),
+    "gravel": ("gravel", 1),
+}
+
+# Pickaxe tier required to harvest each block
+block_harvest_level = {
+    "stone": 0,
+    "coal_ore": 0,
+    "iron_ore": 1,
+    "lapis_ore": 1,
+    "gold_ore": 2,
+    "diamond_ore": 2,
+    "redstone_ore": 2,
+    "emerald_ore": 2,
+}
+
+# Harvest level and number of uses for each tool
+tools = {
+    "wooden_pickaxe": (0, 59),
+    "stone_pickaxe": (1, 131),
+    "iron_pickaxe": (2, 250),
+    "diamond_pickaxe": (3, 1561),
+}
+
+smelting = {
+    "iron_ore": "iron",
+    "gold_ore": "gold",
+    "raw_circuit": "circuit",
+}
+
+# The geolyzer reads bedrock (and the void beyond the generated world) as -1
+out_of_bounds_hardness = -1.0
+
+# Inventory slots that make up the crafting grid, in row order
+crafting_grid_slots = [1, 2, 3, 5, 6, 7, 9, 10, 11]
+
+directions = {
+    "north": (0, 0, -1),
+    "east": (1, 0, 0),
+    "south": (0, 0, 1),
+    "west": (-1, 0, 0),
+}
+turn_order = ["north", "east", "south", "west"]
+
+# Commands that close the connection or don't reply with json can't be part of a batch
+unbatchable = ["batch", "update", "exit", "reboot", "scan_region"]
+
+default_items = {
+    "log": 16,
+    "cobblestone": 32,
+    "stone_pickaxe": 2,
+    "iron_pickaxe": 1,
+}
+
+
+class CommandError(Exception):
+    """Raised by command handlers to reply with {"success": false}"""
+
+
+class SimulatedRobot:
+    """
+    A robot running in a simulated world.
+
+    Attributes:
+    id: int
+        The robot's identifier, sent to the server when connecting.
+    position: tuple
+        The robot's position in world coordinates. Positions above the top of the world are open air.
+    direction: str
+        The cardinal direction the robot is facing.
+    inventory: list
+        [item, count] pairs or None for each slot. 1-indexed like the real robot, with an unused slot 0.
+    latency: float
+        Seconds of artificial delay added before every response.
+    geolyzer_noise: float
+        Maximum geolyzer error at 33 blocks away, increasing linearly with distance like the in-game geolyzer.
+    """
+
+    def __init__(self, id: int, environment: world.World, position: tuple[int, int, int],
+                 inventory_size: int = 64, items: dict[str, int] = None,
+                 latency: float = 0.0, geolyzer_noise: float = 2.0, seed: int = None):
+        self.id = id
+        self.world = environment
+        self.position = position
+        self.direction = "north"
+        self.latency = latency
+        self.geolyzer_noise = geolyzer_noise
+        self.rng = np.random.default_rng(seed)
+
+        self.inventory: list[list | None] = [None] * (inventory_size + 1)
+        self.selected = 1
+        self.tool: list | None = None
+        self.tool_uses = 0
+        # Blocks the robot has placed, such as furnaces and assemblers, and their inventories
+        self.placed_blocks: dict[tuple[int, int, int], str] = {}
+        self.containers: dict[tuple[int, int, int], dict[int, list]] = {}
+
+        for item, count in (default_items if items is None else items).items():
+            self._insert_item(item, count)
+
+        # Stand-in for the client's inventory_changed listener, see _track_inventory_changes
+        self.inventory_session = f"{random.getrandbits(32):x}"
+        self.inventory_generation = 0
+        self.slot_generations: dict[int, int] = {}
+        self._last_inventory = [list(stack) if stack else None for stack in self.inventory]
+
+        self.connected = False
+        self.commands_handled = 0
+        # Calls the real client would make to geolyzer.scan
+        self.geolyzer_calls = 0
+
+    # Networking
+    ############
+
+    async def run(self, host="localhost", port=3000):
+        """Connect to the server and handle commands until the connection closes or the exit command is received."""
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(f"{self.id};".encode())
+        await writer.drain()
+        if await reader.readline() != b"ack;\n":
+            writer.close()
+            raise ConnectionError("Server did not acknowledge connection")
+
+        self.connected = True
+        try:
+            while self.connected:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                request_id, _, command = line.decode().strip().rstrip(";").partition(" ")
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+
+                response = self.execute(command)
+                self.commands_handled += 1
+                if isinstance(response, bytes):
+                    writer.write(f"{request_id} #{len(response)}:".encode() + response)
+                else:
+                    writer.write(f"{request_id} {json.dumps(response)};".encode())
+                await writer.drain()
+        finally:
+            self.connected = False
+            writer.close()
+
+    def execute(self, command: str) -> dict | bytes:
+        """Run a command, returning its json response or packed binary payload"""
+        arguments = command.split()
+        if not arguments:
+            return {"success": False, "error": "Unknown command: "}
+
+        if arguments[0] == "batch":
+            return self._batch(command[len("batch "):])
+
+        handler = getattr(self, f"_command_{arguments[0]}", None)
+        if handler is None:
+            return {"success": False, "error": f" Unknown command: {arguments[0]}"}
+        try:
+            return handler(*arguments[1:]) or {"success": True}
+        except CommandError as error:
+            return {"success": False, "error": str(error)}
+        except (TypeError, ValueError) as error:
+            return {"success": False, "error": f"Invalid arguments: {error}"}
+        finally:
+            self._track_inventory_changes()
+
+    def _track_inventory_changes(self):
+        """Bump the generation of every slot that changed, like the client does on inventory_changed signals"""
+        for slot, stack in enumerate(self.inventory):
+            if stack != self._last_inventory[slot]:
+                self.inventory_generation += 1
+                self.slot_generations[slot] = self.inventory_generation
+                self._last_inventory[slot] = list(stack) if stack else None
+
+    def _batch(self, commands: str) -> dict:
+        results = []
+        success = True
+        for entry in [entry for entry in commands.split("|") if entry]:
+            optional = entry.startswith("?")
+            entry = entry.lstrip("?")
+            arguments = entry.split()
+
+            if not arguments or arguments[0] in unbatchable:
+                result = {"success": False, "error": f"Command can't be batched: {entry}"}
+            else:
+                result = self.execute(entry)
+
+            results.append(result)
+            if not optional and not result["success"]:
+                success = False
+                break
+        return {"success": success, "results": results}
+
+    # World interaction
+    ###################
+
+    def _density(self, x, y, z) -> float:
+        # Everything above the generated volume is sky
+        if y >= self.world.y_size:
+            return 0.0
+        return self.world.sample_density(x, y, z)
+
+    def _offset(self, side: str) -> tuple[int, int, int]:
+        if side == "up":
+            return (0, 1, 0)
+        if side == "down":
+            return (0, -1, 0)
+        if side in ["front", None]:
+            direction = self.direction
+        elif side == "back":
+            direction = turn_order[(turn_order.index(self.direction) + 2) % 4]
+        elif side == "left":
+            direction = turn_order[(turn_order.index(self.direction) - 1) % 4]
+        elif side == "right":
+            direction = turn_order[(turn_order.index(self.direction) + 1) % 4]
+        else:
+            raise CommandError("Invalid side")
+        return directions[direction]
+
+    def _adjacent(self, side: str) -> tuple[int, int, int]:
+        dx, dy, dz = self._offset(side)
+        x, y, z = self.position
+        return (x + dx, y + dy, z + dz)
+
+    # Inventory helpers
+    ###################
+
+    def _slot(self, slot) -> int:
+        slot = int(slot)
+        if not 1 <= slot < len(self.inventory):
+            raise CommandError("Slot out of bounds")
+        return slot
+
+    def _insert_item(self, item: str, count: int) -> int:
+        """
+        Add items to the inventory the way the robot does, filling matching stacks and then
+        empty slots starting from the selected slot. Returns the number of items that didn't fit.
+        """
+        stack_size = recipes.stack_size.get(item, 64)
+        slots = list(range(self.selected, len(self.inventory))) + list(range(1, self.selected))
+        for slot in slots:
+            stack = self.inventory[slot]
+            if stack and stack[0] == item and stack[1] < stack_size:
+                moved = min(count, stack_size - stack[1])
+                stack[1] += moved
+                count -= moved
+            if count == 0:
+                return 0
+        for slot in slots:
+            if self.inventory[slot] is None:
+                moved = min(count, stack_size)
+                self.inventory[slot] = [item, moved]
+                count -= moved
+            if count == 0:
+                return 0
+        return count
+
+    def _remove_from_slot(self, slot: int, count: int) -> int:
+        stack = self.inventory[slot]
+        if stack is None:
+            return 0
+        removed = min(count, stack[1])
+        stack[1] -= removed
+        if stack[1] == 0:
+            self.inventory[slot] = None
+        return removed
+
+    @staticmethod
+    def _stack_json(stack: list) -> dict:
+        # The server converts namespaced ids back to item names, any namespace works for items it knows
+        return {"name": f"sim:{stack[0]}", "count": stack[1], "dataValue": 0}
+
+    # Commands
+    ##########
+
+    def _command_ping(self):
+        pass
+
+    def _command_version(self):
+        return {"success": True, "version": client_version}
+
+    def _command_memory(self):
+        return {"success": True, "free": 2**20, "total": 2**21}
+
+    def _command_move(self, side=None):
+        if side not in ["front", "back", "left", "right", "up", "down"]:
+            raise CommandError("Invalid or missing direction")
+        target = self._adjacent(side)
+        if self._density(*target) != 0.0:
+            raise CommandError("something is in the way")
+        # Robots can't fly more than 8 blocks above the ground
+        if side == "up" and target[1] > self.world.y_size + 8:
+            raise CommandError("impossible move")
+        self.position = target
+
+    def _command_turn(self, side=None):
+        if side == "left":
+            self.direction = turn_order[(turn_order.index(self.direction) - 1) % 4]
+        elif side == "right":
+            self.direction = turn_order[(turn_order.index(self.direction) + 1) % 4]
+        else:
+            raise CommandError("Missing or unknown direction")
+
+    def _command_detect(self):
+        def describe(side):
+            solid = self._density(*self._adjacent(side)) != 0.0
+            return {"passable": solid, "type": "solid" if solid else "air"}
+        return {"success": True, "front": describe("front"), "up": describe("up"), "down": describe("down")}
+
+    def _command_use(self, sneaky=None):
+        if self._adjacent("front") not in self.placed_blocks:
+            raise CommandError("No action taken")
+        return {"success": True, "action": "block_activated"}
+
+    def _command_place(self, side="front"):
+        if side not in ["front", "up", "down"]:
+            raise CommandError("Invalid side")
+        stack = self.inventory[self.selected]
+        if stack is None:
+            raise CommandError("Selected inventory slot is empty")
+        target = self._adjacent(side)
+        if self._density(*target) != 0.0:
+            raise CommandError("Placement obstructed")
+
+        self.world.set_block(*target, "stone")
+        self.placed_blocks[target] = stack[0]
+        self.containers[target] = {}
+        self._remove_from_slot(self.selected, 1)
+
+    def _command_swing(self, side="front"):
+        if side not in ["front", "up", "down"]:
+            raise CommandError("Invalid side")
+        target = self._adjacent(side)
+        block = self.world.sample_block(*target) if target[1] < self.world.y_size else "air"
+        if block == "air":
+            raise CommandError("Failed to mine")
+        if block == "bedrock":
+            raise CommandError("Failed to mine")
+
+        if target in self.placed_blocks:
+            # Placed blocks are picked back up, along with anything left inside them
+            self.world.dig(*target)
+            self._insert_item(self.placed_blocks.pop(target), 1)
+            for item, count in self.containers.pop(target).values():
+                self._insert_item(item, count)
+            return
+
+        harvest_level = block_harvest_level.get(block)
+        if harvest_level is not None:
+            if self.tool is None:
+                raise CommandError("no tool equipped")
+            tool_level, max_uses = tools.get(self.tool[0], (-1, 0))
+            if tool_level < harvest_level:
+                raise CommandError("Failed to mine")
+            self.tool_uses += 1
+            if self.tool_uses >= max_uses:
+                self.tool = None
+                self.tool_uses = 0
+
+        self.world.dig(*target)
+        item, count = block_drops.get(block, (None, 0))
+        if item:
+            self._insert_item(item, count)
+
+    def _command_select(self, slot=None):
+        if slot is None:
+            raise CommandError("Missing slot argument")
+        self.selected = self._slot(slot)
+
+    def _command_transfer(self, source_slot=None, dest_slot=None, count=None):
+        if source_slot is None or dest_slot is None:
+            raise CommandError("Invalid or missing slot argument")
+        source_slot, dest_slot = self._slot(source_slot), self._slot(dest_slot)
+        self.selected = source_slot
+
+        source = self.inventory[source_slot]
+        dest = self.inventory[dest_slot]
+        if source is None or source_slot == dest_slot:
+            return
+        count = source[1] if count is None else int(count)
+
+        if dest is None:
+            moved = min(count, source[1])
+            self.inventory[dest_slot] = [source[0], moved]
+            self._remove_from_slot(source_slot, moved)
+        elif dest[0] == source[0]:
+            moved = min(count, source[1], recipes.stack_size.get(dest[0], 64) - dest[1])
+            dest[1] += moved
+            self._remove_from_slot(source_slot, moved)
+        elif count >= source[1]:
+            self.inventory[source_slot], self.inventory[dest_slot] = dest, source
+
+    def _container(self, side) -> dict:
+        if side not in ["front", "up", "down"]:
+            raise CommandError("Invalid side")
+        container = self.containers.get(self._adjacent(side))
+        if container is None:
+            raise CommandError("Inventory not found or failed to transfer item(s)")
+        return container
+
+    def _command_insert(self, side=None, dest_slot=None, count=1):
+        container = self._container(side)
+        if dest_slot is None:
+            raise CommandError("Missing or invalid destination slot")
+        stack = self.inventory[self.selected]
+        if stack is None:
+            raise CommandError("Inventory not found or failed to transfer item(s)")
+
+        dest_slot = int(dest_slot)
+        existing = container.get(dest_slot)
+        if existing and existing[0] != stack[0]:
+            raise CommandError("Inventory not found or failed to transfer item(s)")
+        moved = self._remove_from_slot(self.selected, int(count))
+        if existing:
+            existing[1] += moved
+        else:
+            container[dest_slot] = [stack[0], moved]
+
+    def _command_take(self, side=None, slot=None):
+        container = self._container(side)
+        if slot is None:
+            raise CommandError("Invalid or missing slot number argument")
+        slot = int(slot)
+
+        # Furnaces finish smelting instantly
+        if self.placed_blocks[self._adjacent(side)] == "furnace" and slot == 3 and container.get(1):
+            item, count = container.pop(1)
+            container[3] = [smelting.get(item, item), count + (container[3][1] if container.get(3) else 0)]
+
+        stack = container.pop(slot, None)
+        if stack is None:
+            raise CommandError("Failed to transfer item(s)")
+        leftover = self._insert_item(*stack)
+        if leftover:
+            container[slot] = [stack[0], leftover]
+
+    def _command_read(self, side=None, slot=None):
+        container = self._container(side)
+        if slot is None:
+            raise CommandError("Invalid or missing slot number argument")
+        stack = container.get(int(slot))
+        return {"success": True, "stack": self._stack_json(stack) if stack else None}
+
+    def _command_equip(self, slot=None):
+        if slot is not None:
+            self.selected = self._slot(slot)
+        self.tool, self.inventory[self.selected] = self.inventory[self.selected], self.tool
+        self.tool_uses = 0
+
+    def _command_drop(self, count=None):
+        removed = self._remove_from_slot(self.selected, 64 if count is None else int(count))
+        if removed == 0:
+            raise CommandError("Items not removed from inventory")
+
+    def _command_inventory(self):
+        contents = {str(slot): self._stack_json(stack) for slot, stack in enumerate(self.inventory) if stack}
+        return {"success": True, "inventory": contents, "size": len(self.inventory) - 1,
+                "session": self.inventory_session, "generation": self.inventory_generation}
+
+    def _command_inventory_delta(self, since):
+        since = int(since)
+        changes = {str(slot): self._stack_json(self.inventory[slot]) if self.inventory[slot] else False
+                   for slot, generation in self.slot_generations.items() if generation > since}
+        return {"success": True, "changes": changes, "size": len(self.inventory) - 1,
+                "session": self.inventory_session, "generation": self.inventory_generation}
+
+    def _command_inventory_checksum(self):
+        return {"success": True, "checksum": sum(slot * stack[1] for slot, stack in enumerate(self.inventory) if stack)}
+
+    def _command_durability(self):
+        if self.tool is None:
+            raise CommandError("no tool equipped")
+        if self.tool[0] not in tools:
+            raise CommandError("tool cannot be damaged")
+        return {"success": True, "durability": 1 - self.tool_uses / tools[self.tool[0]][1]}
+
+    def _command_craft(self, count=None):
+        grid = [self.inventory[slot][0] if self.inventory[slot] else None for slot in crafting_grid_slots]
+        item = _match_recipe(grid)
+        if item is None:
+            raise CommandError("Recipe invalid")
+
+        # Limited by the smallest ingredient stack in the grid. Like the crafting
+        # upgrade, the count is of items produced (default and maximum of 64).
+        output = recipes.recipes[item]["output"]
+        crafts = min(self.inventory[slot][1] for slot in crafting_grid_slots if self.inventory[slot])
+        count = 64 if count is None else min(int(count), 64)
+        crafts = min(crafts, max(1, -(-count // output)))
+        for slot in crafting_grid_slots:
+            self._remove_from_slot(slot, crafts)
+        self._insert_item(item, crafts * output)
+
+    def _command_scan(self, radius=12):
+        radius = int(radius)
+        if radius > 15:
+            raise CommandError("radius too large (max 15)")
+        if radius < 1:
+            raise CommandError("radius invalid")
+        width = radius*2 + 1
+
+        self.geolyzer_calls += width * width
+        hardness = self.geolyzer_box([-radius] * 3, [width] * 3)
+
+        # The client's json helper can't write arrays, so nested objects with numeric keys are used instead
+        data = {str(x): {str(y): {str(z): float(value) for z, value in enumerate(column)}
+                         for y, column in enumerate(plane)}
+                for x, plane in enumerate(hardness)}
+        return {"success": True, "data": data}
+
+    def _command_scan_region(self, *arguments):
+        if len(arguments) < 9:
+            raise CommandError("Missing region or tile size")
+        offset, shape, tile = [int(value) for value in arguments[0:3]], [int(value) for value in arguments[3:6]], [int(value) for value in arguments[6:9]]
+        if min(shape + tile) < 1 or tile[0] * tile[1] * tile[2] > 64:
+            raise CommandError("Invalid region or tile size")
+
+        hardness = self.geolyzer_box(offset, shape).astype("<f4")
+        tiles = []
+        for x in range(0, shape[0], tile[0]):
+            for y in range(0, shape[1], tile[1]):
+                for z in range(0, shape[2], tile[2]):
+                    self.geolyzer_calls += 1
+                    # The geolyzer returns values with x changing fastest, then z, then y
+                    tiles.append(hardness[x:x + tile[0], y:y + tile[1], z:z + tile[2]].transpose(1, 2, 0).tobytes())
+        return b"".join(tiles)
+
+    def geolyzer_scan(self, radius: int) -> np.ndarray:
+        """Noisy hardness values for a cube around the robot, indexed [x][y][z] from the lowest corner."""
+        return self.geolyzer_box([-radius] * 3, [radius*2 + 1] * 3)
+
+    def geolyzer_box(self, offset: list[int], shape: list[int]) -> np.ndarray:
+        """Noisy hardness values for a box starting at an offset from the robot, indexed [x][y][z]"""
+        dx, dy, dz = np.meshgrid(*[np.arange(offset[axis], offset[axis] + shape[axis]) for axis in range(3)], indexing="ij")
+        x, y, z = dx + self.position[0], dy + self.position[1], dz + self.position[2]
+        hardness = np.full(x.shape, out_of_bounds_hardness, dtype=np.float32)
+
+        inside = (x >= 0) & (x < self.world.x_size) & (y >= 0) & (y < self.world.y_size) & (z >= 0) & (z < self.world.z_size)
+        hardness[inside] = self.world.sample_densities(x[inside], y[inside], z[inside])
+        hardness[y >= self.world.y_size] = 0.0
+
+        distance = np.sqrt(dx**2 + dy**2 + dz**2)
+        noise = self.rng.uniform(-1, 1, hardness.shape) * self.geolyzer_noise * distance / 33
+        return hardness + noise.astype(np.float32)
+
+    def _command_reboot(self):
+        # Restarting the client loses its record of inventory changes
+        self.inventory_session = f"{random.getrandbits(32):x}"
+        self.inventory_generation = 0
+        self.slot_generations.clear()
+
+    def _command_update(self):
+        pass
+
+    def _command_exit(self):
+        self.connected = False
+
+    def _command_install(self, new_id=None):
+        pass
+
+
+def _match_recipe(grid: list[str | None]) -> str | None:
+    """Find the recipe laid out in a 3x3 crafting grid, allowing the shape to be placed anywhere in the grid."""
+    def trim(cells):
+        rows = [cells[i:i + 3] for i in range(0, 9, 3)]
+        used_rows = [i for i, row in enumerate(rows) if any(row)]
+        used_cols = [j for j in range(3) if any(row[j] for row in rows)]
+        if not used_rows:
+            return ()
+        return tuple(tuple(rows[i][j] for j in range(used_cols[0], used_cols[-1] + 1))
+                     for i in range(used_rows[0], used_rows[-1] + 1))
+
+    shape = trim(grid)
+    for item, recipe in recipes.recipes.items():
+        if trim([cell for row in recipe["recipe"] for cell in row]) == shape:
+            return item
+    return None
+
+
+def spawn_robots(count: int, environment: world.World, first_id: int = 1, **options) -> list[SimulatedRobot]:
+    """Create robots standing on the surface of the world at random positions"""
+    robots = []
+    for i in range(count):
+        position = (random.randrange(environment.x_size), environment.y_size, random.randrange(environment.z_size))
+        robots.append(SimulatedRobot(first_id + i, environment, position, **options))
+    return robots
+
+
+async def _run_all(robots: list[SimulatedRobot], host: str, port: int):
+    results = await asyncio.gather(*[robot.run(host, port) for robot in robots], return_exceptions=True)
+    for robot, result in zip(robots, results):
+        if isinstance(result, Exception):
+            print(f"[{robot.id}] {result.__class__.__name__}: {result}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Connect simulated robots to the server")
+    parser.add_argument("--robots", type=int, default=1, help="Number of robots to simulate")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=3000)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds of delay before each response")
+    parser.add_argument("--noise", type=float, default=2.0, help="Geolyzer noise, matching the geolyzerNoise config option")
+    parser.add_argument("--size", type=int, nargs=3, default=[64, 64, 64], metavar=("X", "Y", "Z"), help="World dimensions")
+    args = parser.parse_args()
+
+    environment = world.World(*args.size)
+    robots = spawn_robots(args.robots, environment, latency=args.latency, geolyzer_noise=args.noise)
+    asyncio.run(_run_all(robots, args.host, args.port))
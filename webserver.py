@@ -1,11 +1,14 @@
 import asyncio
+from collections import deque, namedtuple
 import json
 import logger
+import metrics
 import socket
 import threading
+import time
 import http.server
 
-connections: dict[int, tuple[asyncio.StreamReader, asyncio.StreamWriter]] = {}
+connections: dict[int, "Connection"] = {}
 
 new_connections = []
 removed_connections = []
@@ -14,6 +17,14 @@ connections_updated_event = asyncio.Event()
 
 max_observed_id = 0
 
+# Largest amount of data taken from a socket in one read
+max_read_size = 65536
+# Time span that connection throughput is averaged over, in seconds
+throughput_window = 5.0
+
+# A complete message from a robot. The payload is text, or a memoryview if the frame is binary (ie. scan_region)
+Frame = namedtuple("Frame", ("request_id", "payload", "binary"))
+
 class UpdateServer (http.server.BaseHTTPRequestHandler):
     """Provide robots a way to fetch new copies of their client runtime."""
     def do_GET(self):
@@ -30,6 +41,184 @@ class UpdateServer (http.server.BaseHTTPRequestHandler):
             self.wfile.write(file.read().encode())
 
 
+class FrameDecoder:
+    """
+    Incrementally splits the byte stream from a robot into frames. Frames start with a request ID
+    and a space, followed by either text terminated by a semicolon, or "#<length>:" and a binary payload.
+
+    Received data is appended to a single buffer, and the search for a terminating semicolon resumes 
+    where the last one left off, so every byte is only scanned once no matter how many reads a message
+    is split across. Any number of frames, including partial ones, can be fed in at a time.
+
+    Binary payloads are returned as memoryviews of the buffer they were received into, without copying,
+    so they can be wrapped by np.frombuffer directly. They stay valid after later calls to feed.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        # Start of the frame currently being decoded
+        self.frame_start = 0
+        # Position the search for the end of a text frame continues from
+        self.search_position = 0
+
+    def feed(self, data: bytes) -> list[Frame]:
+        """
+        Add newly received data, and return every frame it completed.
+        Raises ValueError if the stream contains a malformed frame header.
+        """
+        self.buffer += data
+        frames = []
+        while (frame := self._next_frame()) is not None:
+            frames.append(frame)
+
+        # Drop consumed frames. Only the unfinished frame at the end of the buffer gets moved.
+        if self.frame_start > 0:
+            del self.buffer[:self.frame_start]
+            self.search_position -= self.frame_start
+            self.frame_start = 0
+        return frames
+
+    def _next_frame(self) -> Frame | None:
+        buffer = self.buffer
+        id_end = buffer.find(b" ", self.frame_start)
+        if id_end == -1 or id_end + 1 >= len(buffer):
+            return None
+        request_id = int(buffer[self.frame_start:id_end])
+
+        body_start = id_end + 1
+        if buffer[body_start] == ord("#"):
+            length_end = buffer.find(b":", body_start)
+            if length_end == -1:
+                return None
+            payload_start = length_end + 1
+            payload_end = payload_start + int(buffer[body_start + 1:length_end])
+            if payload_end > len(buffer):
+                return None
+            # The payload isn't copied out. The frame takes over the buffer and views the payload within it,
+            # and decoding continues in a new buffer holding only what was received after the payload.
+            frame = Frame(request_id, memoryview(buffer)[payload_start:payload_end], True)
+            self.buffer = buffer[payload_end:]
+            self.frame_start = self.search_position = 0
+            return frame
+
+        terminator = buffer.find(b";", max(body_start, self.search_position))
+        if terminator == -1:
+            self.search_position = len(buffer)
+            return None
+        frame = Frame(request_id, buffer[body_start:terminator], False)
+        self.frame_start = self.search_position = terminator + 1
+        return frame
+
+
+class Connection:
+    """
+    A robot's socket connection. Every command is tagged with a request ID, which the robot echoes 
+    back at the start of its response. A single reader task matches responses to the requests waiting 
+    on them, so commands sent concurrently (ie. manual commands from the TUI while an action is running)
+    can never receive each other's responses, and several commands can be in flight at once.
+    """
+
+    bot_id: int
+    reader: asyncio.StreamReader
+    writer: asyncio.StreamWriter
+    pending: dict[int, asyncio.Future]
+
+    def __init__(self, bot_id: int, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.bot_id = bot_id
+        self.reader = reader
+        self.writer = writer
+        self.pending = {}
+        self.next_request_id = 1
+        # Concurrent drains on the same writer are not allowed
+        self.write_lock = asyncio.Lock()
+
+        self.bytes_received = 0
+        self.frames_received = 0
+        # (time, bytes, frames) for each read within the throughput window
+        self.samples = deque()
+        self.reader_task = asyncio.create_task(self._read_responses())
+
+    async def request(self, message: str) -> str | memoryview:
+        """
+        Send a command and wait for the matching response.
+        Raises ConnectionResetError if the connection is lost before the response arrives.
+        """
+        request_id = self.next_request_id
+        self.next_request_id += 1
+
+        response = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = response
+        try:
+            async with self.write_lock:
+                self.writer.write(f"{request_id} {message};\n".encode())
+                await self.writer.drain()
+            return await response
+        finally:
+            self.pending.pop(request_id, None)
+
+    async def _read_responses(self):
+        decoder = FrameDecoder()
+        try:
+            while True:
+                data = await self.reader.read(max_read_size)
+                if not data:
+                    break  # Connection closed
+
+                frames = decoder.feed(data)
+                self._record_throughput(len(data), len(frames))
+                for frame in frames:
+                    self._dispatch(frame)
+
+        except ValueError as error:
+            logger.error(f"Malformed response frame: {error}", self.bot_id)
+        except (ConnectionResetError, ConnectionAbortedError) as error:
+            logger.error(f"Connection lost: {error.__class__.__name__}", self.bot_id)
+        self.close()
+
+    def _dispatch(self, frame: Frame):
+        response = self.pending.get(frame.request_id)
+        if response is None or response.done():
+            logger.error(f"Received response to unknown request {frame.request_id}", self.bot_id)
+            return
+
+        if frame.binary:
+            response.set_result(frame.payload)
+            return
+        try:
+            response.set_result(frame.payload.decode())
+        except UnicodeDecodeError as error:
+            response.set_exception(error)
+
+    def _record_throughput(self, byte_count: int, frame_count: int):
+        now = time.monotonic()
+        self.bytes_received += byte_count
+        self.frames_received += frame_count
+        self.samples.append((now, byte_count, frame_count))
+        while self.samples[0][0] < now - throughput_window:
+            self.samples.popleft()
+
+    def throughput(self) -> tuple[float, float]:
+        """Average bytes and frames received per second over the last few seconds."""
+        now = time.monotonic()
+        recent = [sample for sample in self.samples if sample[0] >= now - throughput_window]
+        return (sum(sample[1] for sample in recent) / throughput_window, 
+                sum(sample[2] for sample in recent) / throughput_window)
+
+    def close(self):
+        """Close the socket and fail any requests still waiting on a response."""
+        self.writer.close()
+        for response in self.pending.values():
+            if not response.done():
+                response.set_exception(ConnectionResetError("Robot disconnected"))
+        self.pending.clear()
+        if self.reader_task is not asyncio.current_task():
+            self.reader_task.cancel()
+
+        # A reconnected robot will already have replaced this connection
+        if connections.get(self.bot_id) is self:
+            _disconnect(self.bot_id)
+
+
 def _disconnect(id):
     connections.pop(id)
     if id not in removed_connections:
@@ -40,42 +229,56 @@ def get_robots() -> list[int]:
     """Get a list of all connected robots"""
     return list(connections.keys())
 
+def get_throughput() -> dict[int, tuple[float, float]]:
+    """Get the bytes and frames received per second from each connected robot"""
+    return {bot_id: connection.throughput() for bot_id, connection in connections.items()}
+
 # Send a command to a bot, and returns the response. All commands will return a response or acknowledgement.
 # If the connection fails or the bot is not online, the function will return an empty string.
-async def send_command(bot_id: int, message: str) -> str:
+# Commands that request a packed binary response (such as "scan_region") return a memoryview on success.
+async def send_command(bot_id: int, message: str) -> str | memoryview:
     connection = connections.get(bot_id)
     if not connection:
         logger.error(f"Failed to send command ({message}): Bot not connected", bot_id)
         return "{\"success\": false, \"error\": \"Robot not connected\"}"
-    reader, writer = connection
 
     try:
-        writer.write((message + ";\n").encode())
-        message = await _receive_message(reader)
-        if message == "":
-            logger.error(f"Failed to send command ({message}): No response", bot_id)
-            writer.close()
-            _disconnect(bot_id)
-            return "{\"success\": false, \"error\": \"Robot disconnected\"}"
-        else:
-            return message
+        start_time = time.perf_counter()
+        response = await connection.request(message)
+        metrics.record("send_command", time.perf_counter() - start_time)
+        metrics.increment("commands")
+        return response
 
     except ConnectionResetError:
         logger.error(f"Failed to send command ({message}): Connection reset", bot_id)
-        writer.close()
-        _disconnect(bot_id)
+        connection.close()
         return "{\"success\": false, \"error\": \"Robot disconnected\"}"
     except ConnectionAbortedError:
         logger.error(f"Failed to send command ({message}): Connection aborted by host", bot_id)
-        writer.close()
-        _disconnect(bot_id)
+        connection.close()
         return "{\"success\": false, \"error\": \"Robot disconnected\"}"
     
     except UnicodeDecodeError:
         logger.error(f"Response encoding incorrect for command ({message})", bot_id)
+        return "{\"success\": false, \"error\": \"Response encoding incorrect\"}"
+
+
+async def send_batch(bot_id: int, commands: list[str]) -> list[dict]:
+    """
+    Run several commands on a robot in a single round trip, and return their parsed responses.
+    The robot stops at the first command that fails, so the result may be shorter than the list of commands.
+    Prefix a command with "?" to let it fail without stopping the batch (ie. swinging at a block that may be air).
+    If the batch itself could not be run, a list containing only the error response is returned.
+    """
+    response = await send_command(bot_id, "batch " + "|".join(commands))
+    data = json.loads(response)
+    if "results" not in data:
+        return [data]
+    return data["results"]
 
 
 async def _handle_new_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    global max_observed_id
     try:
         message = await _receive_message(reader)
         if not message:
@@ -85,14 +288,18 @@ async def _handle_new_client(reader: asyncio.StreamReader, writer: asyncio.Strea
         
         bot_id = int(message)
 
-        if bot_id in connections:
+        old_connection = connections.get(bot_id)
+        if old_connection:
             logger.info("Bot reconnected - switching to new connection", bot_id)
+            # Replace the entry first, so closing the old socket doesn't register as a disconnect
+            connections[bot_id] = Connection(bot_id, reader, writer)
+            old_connection.close()
         else:
             logger.info(f"Bot connected", bot_id)
+            connections[bot_id] = Connection(bot_id, reader, writer)
 
         # Give the robot something to read to ensure the connect works
         writer.write(("ack;\n").encode())
-        connections[bot_id] = (reader, writer)
         new_connections.append(bot_id)
         if bot_id > max_observed_id:
             max_observed_id = bot_id
@@ -106,24 +313,14 @@ async def _handle_new_client(reader: asyncio.StreamReader, writer: asyncio.Strea
         writer.close()
 
 async def _receive_message(reader: asyncio.StreamReader) -> str:
-    # Breaking the read into smaller chunks fixes an issue with extra large payloads that appears to
-    # lock up the interpreter (Might just be an exception that messes with asyncio & the TUI?)
-    message = b""
-    max_read_size = 32768
-    while True:
-        try:
-            new_chunk = await reader.read(max_read_size)
-            if not new_chunk:
-                return ""  # Connection closed
-            
-            message += new_chunk
-            if new_chunk.endswith(b";"):
-                break
-        except asyncio.IncompleteReadError:
-            return ""
+    """Read a single semicolon terminated message, used for the connection handshake."""
+    try:
+        message = await reader.readuntil(b";")
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        return ""  # Connection closed
 
     # Strip the trailing semicolon
-    return message.decode()[:-1]
+    return message[:-1].decode()
 
 
 async def start_server(host="localhost", port=3000) -> bool:
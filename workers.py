@@ -0,0 +1,57 @@
+"""
+Worker pools for slow, CPU-heavy work that would otherwise stall the event loop,
+which every robot connection and the UI share.
+
+Pure python work (Bayes net queries, building PDDL) holds the GIL, so it runs in a process pool.
+Torch releases the GIL during its computation, so model inference only needs a thread.
+Functions run in the process pool and their arguments must be picklable, so module-level functions
+taking plain values are used rather than methods on objects like Robot.
+"""
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+import os
+
+# Pool sizes, which take effect when the pools are first used
+process_pool_size = max(1, (os.cpu_count() or 2) - 1)
+thread_pool_size = 2
+
+_process_pool: ProcessPoolExecutor | None = None
+_thread_pool: ThreadPoolExecutor | None = None
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        # Forking a process that has torch and asyncio running is unreliable, so workers start fresh
+        _process_pool = ProcessPoolExecutor(max_workers=process_pool_size, mp_context=multiprocessing.get_context("spawn"))
+    return _process_pool
+
+
+def _get_thread_pool() -> ThreadPoolExecutor:
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(max_workers=thread_pool_size, thread_name_prefix="Worker")
+    return _thread_pool
+
+
+async def run_in_process(function, *args):
+    """Run a picklable function in the process pool, returning its result"""
+    return await asyncio.get_running_loop().run_in_executor(_get_process_pool(), function, *args)
+
+
+async def run_in_thread(function, *args):
+    """Run a function that releases the GIL (ie. torch) in the thread pool, returning its result"""
+    return await asyncio.get_running_loop().run_in_executor(_get_thread_pool(), function, *args)
+
+
+def shutdown():
+    """Stop the worker pools, waiting for running work to finish"""
+    global _process_pool, _thread_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(cancel_futures=True)
+        _process_pool = None
+    if _thread_pool is not None:
+        _thread_pool.shutdown(cancel_futures=True)
+        _thread_pool = None
@@ -0,0 +1,104 @@
+"""
+Map of the block hardness around the robots, built up from every geolyzer scan they make.
+
+The world is stored as sparse 16x16x16 chunks of float32 hardness values, allocated when a scan
+first touches them. Unknown blocks are NaN. Coordinates are the absolute positions robots track
+in Robot.position (+x east, +y up, +z south), so scans only line up between robots whose positions
+share the same origin.
+
+Only the most recently written chunks are kept, so the map covers the areas the robots are working in
+rather than everywhere they have ever been.
+"""
+
+import numpy as np
+
+chunk_size = 16
+
+# Hardness of blocks known to be empty, such as after they are mined
+air = 0.0
+
+# Chunks kept before the least recently written ones are dropped (16 KiB each, 32 MiB in total)
+max_chunks = 2048
+
+
+class VoxelMap:
+    """
+    Sparse voxel storage of block hardness, indexed by absolute coordinates.
+
+    Attributes:
+    chunks: dict
+        Chunk coordinates (position // chunk_size) to chunk_size^3 float32 arrays indexed [x][y][z],
+        ordered from least to most recently written.
+    """
+
+    chunks: dict[tuple[int, int, int], np.ndarray]
+
+    def __init__(self):
+        self.chunks = {}
+
+    def _chunks_overlapping(self, origin: tuple[int, int, int], shape: tuple[int, int, int]):
+        """
+        Yield (chunk key, slices within the chunk, slices within the region) for every
+        chunk that overlaps the box starting at origin with the given shape.
+        """
+        first = [origin[axis] // chunk_size for axis in range(3)]
+        last = [(origin[axis] + shape[axis] - 1) // chunk_size for axis in range(3)]
+
+        for cx in range(first[0], last[0] + 1):
+            for cy in range(first[1], last[1] + 1):
+                for cz in range(first[2], last[2] + 1):
+                    chunk_slices = []
+                    region_slices = []
+                    for axis, chunk in enumerate((cx, cy, cz)):
+                        start = max(origin[axis], chunk * chunk_size)
+                        end = min(origin[axis] + shape[axis], (chunk + 1) * chunk_size)
+                        chunk_slices.append(slice(start - chunk * chunk_size, end - chunk * chunk_size))
+                        region_slices.append(slice(start - origin[axis], end - origin[axis]))
+                    yield (cx, cy, cz), tuple(chunk_slices), tuple(region_slices)
+
+    def write(self, origin: tuple[int, int, int], values: np.ndarray):
+        """Store a dense block of hardness values, indexed [x][y][z] with [0][0][0] at origin"""
+        for key, chunk_slices, region_slices in self._chunks_overlapping(origin, values.shape):
+            chunk = self.chunks.pop(key, None)
+            if chunk is None:
+                chunk = np.full((chunk_size, chunk_size, chunk_size), np.nan, dtype=np.float32)
+                while len(self.chunks) >= max_chunks:
+                    del self.chunks[next(iter(self.chunks))]
+            # Reinsert the chunk to mark it as the most recently written
+            self.chunks[key] = chunk
+            chunk[chunk_slices] = values[region_slices]
+
+    def read(self, origin: tuple[int, int, int], shape: tuple[int, int, int]) -> np.ndarray:
+        """Return the hardness of a box of the world as a float32 array, with NaN for unknown blocks"""
+        region = np.full(shape, np.nan, dtype=np.float32)
+        for key, chunk_slices, region_slices in self._chunks_overlapping(origin, shape):
+            chunk = self.chunks.get(key)
+            if chunk is not None:
+                region[region_slices] = chunk[chunk_slices]
+        return region
+
+    def read_around(self, center: tuple[int, int, int], radius: int) -> np.ndarray:
+        """Return the cube of width radius*2+1 centered on a position, in the same layout as a geolyzer scan"""
+        width = radius*2 + 1
+        return self.read(tuple(axis - radius for axis in center), (width, width, width))
+
+    def get(self, x: int, y: int, z: int) -> float:
+        """Hardness of a single block, or NaN if it is unknown"""
+        chunk = self.chunks.get((x // chunk_size, y // chunk_size, z // chunk_size))
+        if chunk is None:
+            return np.nan
+        return float(chunk[x % chunk_size, y % chunk_size, z % chunk_size])
+
+    def set(self, x: int, y: int, z: int, hardness: float):
+        self.write((x, y, z), np.full((1, 1, 1), hardness, dtype=np.float32))
+
+    def known_fraction(self, origin: tuple[int, int, int], shape: tuple[int, int, int]) -> float:
+        """Fraction of the blocks in a box that have been scanned"""
+        return float(np.count_nonzero(~np.isnan(self.read(origin, shape)))) / (shape[0] * shape[1] * shape[2])
+
+    def clear(self):
+        self.chunks.clear()
+
+
+# Map shared by every connected robot
+shared_map = VoxelMap()